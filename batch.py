@@ -0,0 +1,182 @@
+from __future__ import annotations
+from dataclasses import InitVar, dataclass, field
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+from vm import Mode, Opcode, UnknownOpcode, decode
+
+
+@dataclass
+class BatchMachine:
+    """
+    Runs the same program on many lanes in lockstep using NumPy arrays.
+
+    Each lane has its own memory row, instruction pointer, relative base and
+    input vector. On every pass the lanes which are still running are grouped
+    by the instruction they are about to execute, so lanes which branched to
+    different addresses but run the same kind of instruction still share a
+    single vectorized step. A lane stops when it halts or when it runs out of
+    inputs. Memory cells are 64-bit and an arithmetic result which does not
+    fit raises OverflowError.
+    """
+
+    memory: np.ndarray
+    inputs: np.ndarray
+    # How many of the inputs of each lane are real rather than padding
+    input_lengths: InitVar[Optional[Sequence[int]]] = None
+    available: np.ndarray = field(init=False)
+    ip: np.ndarray = field(init=False)
+    relative_base: np.ndarray = field(init=False)
+    input_at: np.ndarray = field(init=False)
+    output: np.ndarray = field(init=False)
+    output_count: np.ndarray = field(init=False)
+    halted: np.ndarray = field(init=False)
+    waiting: np.ndarray = field(init=False)
+
+    def __post_init__(self, input_lengths: Optional[Sequence[int]]) -> None:
+        lanes = len(self.memory)
+        if input_lengths is None:
+            self.available = np.full(lanes, self.inputs.shape[1], dtype=np.int64)
+        else:
+            self.available = np.array(input_lengths, dtype=np.int64)
+        self.ip = np.zeros(lanes, dtype=np.int64)
+        self.relative_base = np.zeros(lanes, dtype=np.int64)
+        self.input_at = np.zeros(lanes, dtype=np.int64)
+        self.output = np.zeros((lanes, 1), dtype=np.int64)
+        self.output_count = np.zeros(lanes, dtype=np.int64)
+        self.halted = np.zeros(lanes, dtype=bool)
+        self.waiting = np.zeros(lanes, dtype=bool)
+
+    @classmethod
+    def from_program(
+        cls,
+        program: Sequence[int],
+        inputs: Sequence[Sequence[int]],
+        memory_size: Optional[int] = None,
+    ) -> BatchMachine:
+        """
+        Creates one lane per input vector. Memory is the program followed by
+        1024 zeroes unless memory_size says otherwise.
+        """
+
+        size = memory_size if memory_size is not None else len(program) + 1024
+        memory = np.zeros((len(inputs), size), dtype=np.int64)
+        memory[:, : len(program)] = program
+
+        width = max((len(lane) for lane in inputs), default=0)
+        lane_inputs = np.zeros((len(inputs), width), dtype=np.int64)
+        for lane, values in enumerate(inputs):
+            lane_inputs[lane, : len(values)] = values
+
+        return cls(memory, lane_inputs, [len(lane) for lane in inputs])
+
+    def outputs(self, lane: int) -> List[int]:
+        return self.output[lane, : self.output_count[lane]].tolist()
+
+    def load(self, lanes: np.ndarray, mode: Mode, param: np.ndarray) -> np.ndarray:
+
+        if mode is Mode.IMMEDIATE:
+            return param
+        elif mode is Mode.RELATIVE:
+            param = self.relative_base[lanes] + param
+        return self.memory[lanes, param]
+
+    def store(
+        self, lanes: np.ndarray, mode: Mode, param: np.ndarray, value: np.ndarray
+    ) -> None:
+
+        if mode is Mode.RELATIVE:
+            param = self.relative_base[lanes] + param
+        self.memory[lanes, param] = value
+
+    def emit(self, lanes: np.ndarray, value: np.ndarray) -> None:
+
+        counts = self.output_count[lanes]
+        if counts.max() >= self.output.shape[1]:
+            self.output = np.pad(self.output, ((0, 0), (0, self.output.shape[1])))
+        self.output[lanes, counts] = value
+        self.output_count[lanes] += 1
+
+    def execute(self) -> None:
+
+        width = self.memory.shape[1]
+        offsets = np.arange(1, 4)
+
+        while True:
+
+            running = np.flatnonzero(~(self.halted | self.waiting))
+            if not running.size:
+                return
+
+            ips = self.ip[running]
+            values = self.memory[running, ips]
+
+            # Parameters past the end of memory can't belong to the instruction
+            # so clamp them instead of reading out of bounds
+            params = self.memory[
+                running[:, None], np.minimum(ips[:, None] + offsets, width - 1)
+            ]
+
+            for value in np.unique(values):
+
+                group = values == value
+                lanes = running[group]
+                a, b, c = params[group].T
+                ip = ips[group]
+
+                instruction = decode(int(value))
+                opcode = instruction.opcode
+                modes = instruction.modes
+
+                if opcode is Opcode.ADD or opcode is Opcode.MULTIPLY:
+                    x = self.load(lanes, modes[0], a)
+                    y = self.load(lanes, modes[1], b)
+                    if opcode is Opcode.ADD:
+                        result = x + y
+                        overflow = ((x ^ result) & (y ^ result)) < 0
+                    else:
+                        result = x * y
+                        overflow = np.abs(x.astype(float) * y) >= 2.0 ** 63
+                    if overflow.any():
+                        raise OverflowError(f"Result does not fit in 64 bits: {ip}")
+                    self.store(lanes, modes[2], c, result)
+                    self.ip[lanes] = ip + 4
+                elif opcode is Opcode.LESS_THAN:
+                    x = self.load(lanes, modes[0], a)
+                    y = self.load(lanes, modes[1], b)
+                    self.store(lanes, modes[2], c, (x < y).astype(np.int64))
+                    self.ip[lanes] = ip + 4
+                elif opcode is Opcode.EQUALS:
+                    x = self.load(lanes, modes[0], a)
+                    y = self.load(lanes, modes[1], b)
+                    self.store(lanes, modes[2], c, (x == y).astype(np.int64))
+                    self.ip[lanes] = ip + 4
+                elif opcode is Opcode.JUMP_IF_TRUE:
+                    x = self.load(lanes, modes[0], a)
+                    y = self.load(lanes, modes[1], b)
+                    self.ip[lanes] = np.where(x != 0, y, ip + 3)
+                elif opcode is Opcode.JUMP_IF_FALSE:
+                    x = self.load(lanes, modes[0], a)
+                    y = self.load(lanes, modes[1], b)
+                    self.ip[lanes] = np.where(x == 0, y, ip + 3)
+                elif opcode is Opcode.RELATIVE_BASE:
+                    self.relative_base[lanes] += self.load(lanes, modes[0], a)
+                    self.ip[lanes] = ip + 2
+                elif opcode is Opcode.SAVE:
+                    # Lanes which have consumed all of their inputs stop here
+                    starved = self.input_at[lanes] >= self.available[lanes]
+                    self.waiting[lanes[starved]] = True
+                    fed = ~starved
+                    lanes, a, ip = lanes[fed], a[fed], ip[fed]
+                    received = self.inputs[lanes, self.input_at[lanes]]
+                    self.store(lanes, modes[0], a, received)
+                    self.input_at[lanes] += 1
+                    self.ip[lanes] = ip + 2
+                elif opcode is Opcode.PRINT:
+                    self.emit(lanes, self.load(lanes, modes[0], a))
+                    self.ip[lanes] = ip + 2
+                elif opcode is Opcode.HALT:
+                    self.halted[lanes] = True
+                else:
+                    raise UnknownOpcode(f"Unknown opcode: {instruction}")
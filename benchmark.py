@@ -0,0 +1,208 @@
+import os
+import sys
+import json
+import time
+import argparse
+import itertools
+from typing import Callable, Dict, List, Sequence, Type
+
+from vm import Machine, Memory, Channel
+from image import load_program
+from compiler import CompiledMachine
+from network import Network
+from day13 import Screen
+
+# A workload runs the program with the given backend and returns the number
+# of instructions it executed. Every workload also checks the answers of its
+# day so a backend which is fast but wrong does not pass as an improvement.
+Workload = Callable[[Type[Machine], Sequence[int]], int]
+
+BACKENDS: Dict[str, Type[Machine]] = {
+    "interpreter": Machine,
+    "compiler": CompiledMachine,
+}
+
+
+def day2(backend: Type[Machine], program: Sequence[int]) -> int:
+
+    memory = Memory(program)
+    instructions = 0
+    for noun, verb in itertools.product(range(100), range(100)):
+        machine = backend(memory, [])
+        machine.memory[1] = noun
+        machine.memory[2] = verb
+        machine.execute()
+        instructions += machine.cycles
+        if machine.memory[0] == 19690720:
+            break
+    assert 100 * noun + verb == 7912
+    return instructions
+
+
+def day5(backend: Type[Machine], program: Sequence[int]) -> int:
+
+    instructions = 0
+    diagnostics: List[int] = []
+    for system in (1, 5):
+        machine = backend(program, [system])
+        machine.execute()
+        instructions += machine.cycles
+        diagnostics.append(machine.output[-1])
+    assert diagnostics == [12428642, 918655]
+    return instructions
+
+
+def day7(backend: Type[Machine], program: Sequence[int]) -> int:
+
+    memory = Memory(program)
+    instructions = 0
+    series = 0
+    for sequence in itertools.permutations(range(5)):
+        signal = 0
+        for setting in sequence:
+            amplifier = backend(memory, [setting, signal])
+            amplifier.execute()
+            signal = amplifier.output[0]
+            instructions += amplifier.cycles
+        series = max(series, signal)
+    assert series == 20413
+
+    feedback = 0
+    for sequence in itertools.permutations(range(5, 10)):
+        amps = [backend(memory, [setting]) for setting in sequence]
+        network = Network.ring(amps)
+        network.send(0, 0)
+        network.run()
+        instructions += sum(amp.cycles for amp in amps)
+        feedback = max(feedback, amps[0].inputs[-1])
+    assert feedback == 3321777
+
+    return instructions
+
+
+def day9(backend: Type[Machine], program: Sequence[int]) -> int:
+
+    instructions = 0
+    outputs: List[int] = []
+    for mode in (1, 2):
+        machine = backend(program, [mode])
+        machine.execute()
+        instructions += machine.cycles
+        outputs.extend(machine.output)
+    assert outputs == [2406950601, 83239]
+    return instructions
+
+
+def day13(backend: Type[Machine], program: Sequence[int]) -> int:
+
+    screen = Screen()
+    machine = backend(program, [], output=Channel(maxlen=3, consumer=screen.update))
+    machine.memory[0] = 2
+    machine.execute()
+    machine.inputs.append(0)
+    while not machine.halted:
+        machine.execute()
+        machine.inputs.append(-1 if screen.ball < screen.paddle else 1)
+    assert screen.score == 17590
+    return machine.cycles
+
+
+def day19(backend: Type[Machine], program: Sequence[int]) -> int:
+
+    memory = Memory(program)
+    instructions = 0
+    affected = 0
+    for y, x in itertools.product(range(50), range(50)):
+        machine = backend(memory, [x, y])
+        machine.execute()
+        instructions += machine.cycles
+        affected += machine.output[0]
+    assert affected == 121
+    return instructions
+
+
+WORKLOADS: Dict[str, Workload] = {
+    "day2": day2,
+    "day5": day5,
+    "day7": day7,
+    "day9": day9,
+    "day13": day13,
+    "day19": day19,
+}
+
+
+def measure(workload: str, backend: str, repeat: int) -> Dict[str, float]:
+
+    program = load_program(os.path.join("inputs", f"{workload}.in"))
+
+    # Keep the best of the runs to filter out noise from the rest of the system
+    best = float("inf")
+    instructions = 0
+    for _ in range(repeat):
+        started = time.perf_counter()
+        instructions = WORKLOADS[workload](BACKENDS[backend], program)
+        best = min(best, time.perf_counter() - started)
+
+    return {
+        "seconds": best,
+        "instructions": instructions,
+        "ips": instructions / best,
+    }
+
+
+def compare(
+    results: Dict[str, Dict[str, Dict[str, float]]],
+    baseline: Dict[str, Dict[str, Dict[str, float]]],
+    tolerance: float,
+) -> List[str]:
+
+    regressions = []
+    for workload, backends in results.items():
+        for backend, result in backends.items():
+            previous = baseline.get(workload, {}).get(backend)
+            if previous is None:
+                continue
+            change = result["ips"] / previous["ips"] - 1
+            print(f"{workload:>6} {backend:>12} {change:+8.1%} vs baseline")
+            if change < -tolerance:
+                regressions.append(f"{workload}/{backend}")
+    return regressions
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Benchmark the Intcode VM")
+    parser.add_argument("--workload", action="append", choices=list(WORKLOADS))
+    parser.add_argument("--backend", action="append", choices=list(BACKENDS))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--baseline", help="compare against results in this file")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.1,
+        help="relative slowdown against the baseline reported as a regression",
+    )
+    args = parser.parse_args()
+
+    results: Dict[str, Dict[str, Dict[str, float]]] = {}
+    for workload in args.workload or WORKLOADS:
+        for backend in args.backend or BACKENDS:
+            result = measure(workload, backend, args.repeat)
+            results.setdefault(workload, {})[backend] = result
+            print(
+                f"{workload:>6} {backend:>12} {result['seconds']:8.3f}s "
+                f"{result['instructions']:>10} instructions "
+                f"{result['ips']:>12,.0f} instructions/s"
+            )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print(f"Regressed: {', '.join(regressions)}")
+            sys.exit(1)
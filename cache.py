@@ -0,0 +1,310 @@
+import os
+import types
+import pickle
+import hashlib
+import functools
+import collections
+import weakref
+from dataclasses import dataclass, field
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Hashable,
+    List,
+    Optional,
+    OrderedDict,
+    Sequence,
+    Tuple,
+    TypeVar,
+    Union,
+)
+
+from vm import Machine, Memory
+
+R = TypeVar("R")
+
+Key = Tuple[Hashable, str, Tuple[Hashable, ...]]
+
+# Digests of memories together with the pages they were computed from
+_digests: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+# Returned by lookups which miss since None is a perfectly good result
+_MISSING = object()
+
+
+def code_digest(code: types.CodeType) -> str:
+    """Hash of compiled code which changes whenever the code is edited"""
+
+    hasher = hashlib.blake2b(digest_size=8)
+    hasher.update(code.co_code)
+    hasher.update(repr(code.co_names).encode())
+    for constant in code.co_consts:
+        # Nested functions show up as code objects whose repr has an address
+        if isinstance(constant, types.CodeType):
+            hasher.update(code_digest(constant).encode())
+        else:
+            hasher.update(repr(constant).encode())
+    return hasher.hexdigest()
+
+
+def function_digest(function: Callable[..., Any]) -> Optional[str]:
+    """
+    Hash of the code, default arguments and closure of a function, or None if
+    it has no code or any of the others has no repr which stays the same from
+    one process to the next, such as an object whose repr is its address
+    """
+
+    code = getattr(function, "__code__", None)
+    if code is None:
+        return None
+
+    parts = [
+        repr(getattr(function, "__defaults__", None)),
+        repr(getattr(function, "__kwdefaults__", None)),
+    ]
+    for cell in getattr(function, "__closure__", None) or ():
+        try:
+            parts.append(repr(cell.cell_contents))
+        except ValueError:
+            # The variable has not been assigned yet
+            return None
+    captured = "\n".join(parts)
+    if " at 0x" in captured:
+        return None
+
+    hasher = hashlib.blake2b(digest_size=8)
+    hasher.update(code_digest(code).encode())
+    hasher.update(captured.encode())
+    return hasher.hexdigest()
+
+
+def immutable(program: Union[Machine, Memory, Sequence[int]]) -> bool:
+
+    if isinstance(program, memoryview):
+        return program.readonly
+    return isinstance(program, (tuple, bytes, range))
+
+
+def digest(program: Union[Machine, Memory, Sequence[int]]) -> str:
+    """
+    Hash of the contents of a program. Pages of zeroes are skipped so a
+    program and a Memory created from it have the same digest. The digest
+    of a machine covers its registers, settings and channels as well as its
+    memory. Machines pulling inputs from a lazy source can not be digested
+    since the inputs still to come are unknown, and neither can machines
+    whose output goes to a consumer.
+    """
+
+    if isinstance(program, Machine):
+        if program.inputs.source is not None:
+            raise ValueError("Can not digest a machine with a lazy input source")
+        if program.output.consumer is not None:
+            raise ValueError("Can not digest a machine with an output consumer")
+        state = (
+            program.ip,
+            program.relative_base,
+            program.pause_on_output,
+            list(program.inputs),
+            list(program.output),
+            program.output.maxlen,
+        )
+        return digest(program.memory) + hashlib.blake2b(
+            repr(state).encode(), digest_size=8
+        ).hexdigest()
+
+    memory = program if isinstance(program, Memory) else Memory(program)
+    pages = list(memory.pages.items())
+
+    # A memory which owns none of its pages copies a page before writing to
+    # it, so while it still holds the very same page objects it is unchanged
+    cached = _digests.get(memory)
+    if (
+        cached is not None
+        and not memory.owned
+        and len(cached[0]) == len(pages)
+        and all(a is b for a, (_, b) in zip(cached[0], pages))
+    ):
+        return cached[1]
+
+    hasher = hashlib.blake2b(digest_size=16)
+    for number, page in sorted(pages):
+        if any(page):
+            hasher.update(f"{number}:{list(page)}".encode())
+    result = hasher.hexdigest()
+
+    if not memory.owned:
+        # Keep the pages alive so that their ids can not be reused
+        _digests[memory] = ([page for _, page in pages], result)
+    return result
+
+
+@dataclass
+class RunCache:
+    """
+    Memoizes the results of pure machine runs, ones whose result depends on
+    nothing but the program, or the machine it starts from, and the
+    arguments. Wrap such a function with
+    memoize and it is only called for programs and arguments it has not seen
+    before. The most recently used capacity results are kept in memory and,
+    if a directory is given, every result is written there as well so that
+    it survives the process. The directory is trimmed back to disk_limit
+    bytes by removing the results which were used least recently.
+
+    Results are told apart by the function itself in memory and on disk by
+    its name, code, default arguments and the values its closure captured.
+    Globals the function reads are not covered. Functions for which those
+    can not be hashed reliably are only cached in memory.
+    """
+
+    capacity: int = 1 << 16
+    directory: Optional[str] = None
+    disk_limit: int = 64 << 20
+    hits: int = 0
+    disk_hits: int = 0
+    misses: int = 0
+    entries: OrderedDict[Key, Any] = field(default_factory=collections.OrderedDict)
+    disk_usage: Optional[int] = None
+
+    def memoize(self, function: Callable[..., R]) -> Callable[..., R]:
+        """Caches function(program, *args) by the program digest and args"""
+
+        name = None
+        stored = function_digest(function)
+        if stored is not None:
+            name = f"{function.__module__}.{function.__qualname__}.{stored}"
+
+        # The same program tends to be passed over and over again, so the
+        # digest of the last one is kept if it can not change in the meantime
+        last: List[Any] = [None, ""]
+
+        @functools.wraps(function)
+        def wrapper(
+            program: Union[Machine, Memory, Sequence[int]], *args: Hashable
+        ) -> R:
+            if program is last[0]:
+                address = last[1]
+            else:
+                address = digest(program)
+                if immutable(program):
+                    last[:] = [program, address]
+            key: Key = (function, address, args)
+            stored_key = None if name is None else (name, address, args)
+            result = self.get(key, stored_key)
+            if result is _MISSING:
+                result = function(program, *args)
+                self.put(key, stored_key, result)
+            return result
+
+        return wrapper
+
+    def get(self, key: Key, stored_key: Optional[Key]) -> Any:
+        """Looks key up in memory and then stored_key, if any, up on disk"""
+
+        result = self.entries.get(key, _MISSING)
+        if result is not _MISSING:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return result
+
+        result = _MISSING if stored_key is None else self.read(stored_key)
+        if result is not _MISSING:
+            self.remember(key, result)
+            self.disk_hits += 1
+            return result
+
+        self.misses += 1
+        return _MISSING
+
+    def put(self, key: Key, stored_key: Optional[Key], result: Any) -> None:
+
+        self.remember(key, result)
+        if stored_key is not None:
+            self.write(stored_key, result)
+
+    def remember(self, key: Key, result: Any) -> None:
+
+        self.entries[key] = result
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+
+    def path(self, key: Key) -> str:
+
+        assert self.directory is not None
+        name = hashlib.blake2b(repr(key).encode(), digest_size=16).hexdigest()
+        return os.path.join(self.directory, name)
+
+    def read(self, key: Key) -> Any:
+
+        if self.directory is None:
+            return _MISSING
+
+        path = self.path(key)
+        try:
+            with open(path, "rb") as f:
+                stored, result = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return _MISSING
+        if stored != key:
+            return _MISSING
+
+        # Mark the result as recently used for eviction
+        os.utime(path)
+        return result
+
+    def write(self, key: Key, result: Any) -> None:
+
+        if self.directory is None:
+            return
+
+        os.makedirs(self.directory, exist_ok=True)
+        data = pickle.dumps((key, result))
+        path = self.path(key)
+        temporary = f"{path}.{os.getpid()}"
+        with open(temporary, "wb") as f:
+            f.write(data)
+        os.replace(temporary, path)
+
+        if self.disk_usage is None:
+            self.disk_usage = sum(size for _, size, _ in self.stored())
+        else:
+            self.disk_usage += len(data)
+        if self.disk_usage > self.disk_limit:
+            self.evict()
+
+    def stored(self) -> List[Tuple[float, int, str]]:
+        """(last used, size, path) of every result in the directory"""
+
+        assert self.directory is not None
+        stored = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file():
+                stat = entry.stat()
+                stored.append((stat.st_mtime, stat.st_size, entry.path))
+        return stored
+
+    def evict(self) -> None:
+
+        # Make room for a while instead of evicting on every write
+        target = self.disk_limit * 3 // 4
+        stored = sorted(self.stored())
+        usage = sum(size for _, size, _ in stored)
+        for _, size, path in stored:
+            if usage <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            usage -= size
+        self.disk_usage = usage
+
+    def stats(self) -> Dict[str, int]:
+
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "entries": len(self.entries),
+        }
@@ -0,0 +1,295 @@
+from __future__ import annotations
+from dataclasses import dataclass, field
+from typing import Callable, ClassVar, Dict, List, Optional, Set, Tuple
+
+from vm import (
+    Instruction,
+    Machine,
+    Mode,
+    Opcode,
+    UnknownOpcode,
+    decode,
+    PAGE_BITS,
+    PAGE_MASK,
+    PARAMETERS,
+)
+
+
+# A compiled block runs the instructions starting from its address and
+# returns whether the machine can keep on running or not
+Block = Callable[[Machine], bool]
+
+
+def read(addr: str) -> str:
+
+    # Addresses known at compile time get their page lookups resolved too
+    if addr.isdigit():
+        page, offset = int(addr) >> PAGE_BITS, int(addr) & PAGE_MASK
+        return f"pages[{page}][{offset}]"
+    return f"pages[(a := {addr}) >> {PAGE_BITS}][a & {PAGE_MASK}]"
+
+
+def operand(mode: Mode, param: Optional[int], cell: int) -> str:
+
+    # Parameters which the program keeps rewriting are read at runtime
+    value = str(param) if param is not None else read(str(cell))
+    if mode is Mode.POSITION:
+        return read(value)
+    elif mode is Mode.RELATIVE:
+        return read(f"rb + {value}")
+    else:
+        return value
+
+
+def address(mode: Mode, param: Optional[int], cell: int) -> str:
+
+    value = str(param) if param is not None else read(str(cell))
+    if mode is Mode.RELATIVE:
+        return f"rb + {value}"
+    return value
+
+
+@dataclass
+class CompiledMachine(Machine):
+    """
+    Drop-in replacement for Machine which translates straight-line runs of
+    instructions into Python functions with operand modes resolved up front.
+
+    Every cell of a compiled block is tracked so that a program writing over
+    its own code throws the affected blocks away and recompiles them the next
+    time they are reached. Parameters which have been written over once are
+    from then on read at runtime like the interpreter does, since programs
+    tend to patch the same operands over and over again. Writes made to
+    memory from the outside once the machine has started running must be
+    followed by a call to invalidate().
+
+    Blocks start out cold with every parameter read at runtime, which lets
+    machines running the same program with different data share them, and
+    only get specialized once they have been entered HOT times.
+    """
+
+    blocks: Dict[int, Block] = field(default_factory=dict, init=False, repr=False)
+    cold: Dict[int, Block] = field(default_factory=dict, init=False, repr=False)
+    heat: Dict[int, int] = field(default_factory=dict, init=False, repr=False)
+    cells: Dict[int, List[int]] = field(default_factory=dict, init=False, repr=False)
+    code: Dict[int, List[int]] = field(default_factory=dict, init=False, repr=False)
+    volatile: Set[int] = field(default_factory=set, init=False, repr=False)
+
+    # Blocks are shared between machines running identical code
+    compiled: ClassVar[Dict[Tuple[Optional[int], ...], Block]] = {}
+
+    HOT: ClassVar[int] = 8
+
+    def fork(self) -> CompiledMachine:
+
+        machine = super().fork()
+        # Forks compile their own blocks since self-modification is tracked
+        # per machine, but they can still reuse the shared compiled code
+        machine.blocks = {}
+        machine.cold = {}
+        machine.heat = {}
+        machine.cells = {}
+        machine.code = {}
+        machine.volatile = set(self.volatile)
+        return machine
+
+    def invalidate(self, addr: int = -1) -> None:
+
+        if addr == -1:
+            self.blocks.clear()
+            self.cold.clear()
+            self.cells.clear()
+            self.code.clear()
+            return
+
+        self.volatile.add(addr)
+        for start in self.code.get(addr, [])[:]:
+            self.discard(start)
+
+    def discard(self, start: int) -> None:
+
+        self.blocks.pop(start, None)
+        self.cold.pop(start, None)
+        for cell in self.cells.pop(start):
+            starts = self.code[cell]
+            starts.remove(start)
+            if not starts:
+                del self.code[cell]
+
+    def warm(self, start: int) -> Block:
+
+        heat = self.heat[start] = self.heat.get(start, 0) + 1
+        if heat >= CompiledMachine.HOT:
+            return self.compile(start)
+
+        block = self.cold.get(start)
+        if block is None:
+            block = self.compile(start, cold=True)
+        return block
+
+    def compile(self, start: int, cold: bool = False) -> Block:
+
+        if start in self.cells:
+            self.discard(start)
+
+        instructions: List[Tuple[int, Instruction, List[Optional[int]]]] = []
+        key: List[Optional[int]] = [start]
+        cells: List[int] = []
+
+        ip = start
+        while True:
+            try:
+                instruction = decode(self.memory[ip])
+            except UnknownOpcode:
+                if ip == start:
+                    raise
+                break
+            key.append(self.memory[ip])
+            cells.append(ip)
+            params: List[Optional[int]] = []
+            for cell in range(ip + 1, ip + 1 + PARAMETERS[instruction.opcode]):
+                if cold or cell in self.volatile:
+                    params.append(None)
+                else:
+                    params.append(self.memory[cell])
+                    cells.append(cell)
+            key.extend(params)
+            instructions.append((ip, instruction, params))
+            ip += 1 + len(params)
+            if instruction.opcode in (
+                Opcode.JUMP_IF_TRUE,
+                Opcode.JUMP_IF_FALSE,
+                Opcode.HALT,
+            ):
+                break
+
+        block = CompiledMachine.compiled.get(tuple(key))
+        if block is None:
+            block = generate(start, ip, instructions)
+            CompiledMachine.compiled[tuple(key)] = block
+
+        if cold:
+            self.cold[start] = block
+        else:
+            self.blocks[start] = block
+        self.cells[start] = cells
+        for cell in cells:
+            self.code.setdefault(cell, []).append(start)
+
+        return block
+
+    def execute(self, limit: Optional[int] = None) -> None:
+        """
+        Runs the machine like Machine.execute does, except that a limit is
+        only checked between blocks so it may be overshot by a block
+        """
+
+        if self.profile is not None:
+            # Profiling steps through the interpreter which does not keep
+            # compiled blocks up to date with what it writes
+            self.profile.execute(self, limit)
+            self.invalidate()
+            return
+
+        blocks = self.blocks
+        stop = self.cycles + limit if limit is not None else None
+        while stop is None or self.cycles < stop:
+            block = blocks.get(self.ip)
+            if block is None:
+                block = self.warm(self.ip)
+            if not block(self):
+                return
+
+
+def generate(
+    start: int,
+    end: int,
+    instructions: List[Tuple[int, Instruction, List[Optional[int]]]],
+) -> Block:
+
+    lines = [
+        f"def block_{start}(m):",
+        "    pages = m.memory.pages",
+        "    write = m.memory.__setitem__",
+        "    code = m.code",
+        "    rb = m.relative_base",
+    ]
+    rb_changed = False
+
+    def leave(ip: int, running: bool, executed: int, indent: str = "    ") -> None:
+        if rb_changed:
+            lines.append(f"{indent}m.relative_base = rb")
+        if executed:
+            lines.append(f"{indent}m.cycles += {executed}")
+        lines.append(f"{indent}m.ip = {ip}")
+        lines.append(f"{indent}return {running}")
+
+    def store(target: str, value: str, next_ip: int, executed: int) -> None:
+        lines.append(f"    addr = {target}")
+        lines.append(f"    write(addr, {value})")
+        # The program wrote over compiled code so bail out and recompile
+        lines.append("    if addr in code:")
+        lines.append("        m.invalidate(addr)")
+        leave(next_ip, True, executed, "        ")
+
+    for executed, (ip, instruction, params) in enumerate(instructions):
+
+        opcode = instruction.opcode
+        modes = instruction.modes
+        next_ip = ip + 1 + len(params)
+        args = [
+            operand(mode, param, ip + 1 + i)
+            for i, (mode, param) in enumerate(zip(modes, params))
+        ]
+        target = address(modes[2], params[2], ip + 3) if len(params) == 3 else ""
+
+        # Instructions executed once the current one has been executed
+        done = executed + 1
+
+        if opcode is Opcode.ADD:
+            store(target, f"{args[0]} + {args[1]}", next_ip, done)
+        elif opcode is Opcode.MULTIPLY:
+            store(target, f"{args[0]} * {args[1]}", next_ip, done)
+        elif opcode is Opcode.LESS_THAN:
+            store(target, f"1 if {args[0]} < {args[1]} else 0", next_ip, done)
+        elif opcode is Opcode.EQUALS:
+            store(target, f"1 if {args[0]} == {args[1]} else 0", next_ip, done)
+        elif opcode is Opcode.SAVE:
+            lines.append("    value = m.inputs.receive()")
+            lines.append("    if value is None:")
+            leave(ip, False, executed, "        ")
+            store(address(modes[0], params[0], ip + 1), "value", next_ip, done)
+        elif opcode is Opcode.PRINT:
+            lines.append(f"    m.output.send({args[0]})")
+            lines.append("    if m.pause_on_output:")
+            leave(next_ip, False, done, "        ")
+        elif opcode is Opcode.RELATIVE_BASE:
+            lines.append(f"    rb += {args[0]}")
+            rb_changed = True
+        elif opcode is Opcode.JUMP_IF_TRUE:
+            if rb_changed:
+                lines.append("    m.relative_base = rb")
+            lines.append(f"    m.cycles += {done}")
+            lines.append(f"    m.ip = {args[1]} if {args[0]} != 0 else {next_ip}")
+            lines.append("    return True")
+        elif opcode is Opcode.JUMP_IF_FALSE:
+            if rb_changed:
+                lines.append("    m.relative_base = rb")
+            lines.append(f"    m.cycles += {done}")
+            lines.append(f"    m.ip = {args[1]} if {args[0]} == 0 else {next_ip}")
+            lines.append("    return True")
+        elif opcode is Opcode.HALT:
+            leave(ip, False, executed)
+
+    # Block ran into something which is not code (yet) so let the
+    # dispatcher take a look at it once the block has run
+    if instructions[-1][1].opcode not in (
+        Opcode.JUMP_IF_TRUE,
+        Opcode.JUMP_IF_FALSE,
+        Opcode.HALT,
+    ):
+        leave(end, True, len(instructions))
+
+    namespace: Dict[str, Block] = {}
+    exec("\n".join(lines), namespace)
+    return namespace[f"block_{start}"]
@@ -1,4 +1,6 @@
 import os
+import numpy as np
+from typing import Iterator, Tuple
 
 
 def fuel_required(mass: int) -> int:
@@ -15,13 +17,59 @@ def total_fuel_required(fuel: int) -> int:
     return fuel + total_fuel_required(needed_fuel)
 
 
+def read_masses(path: str, chunk_size: int = 1 << 24) -> Iterator[np.ndarray]:
+    """
+    Streams the masses in the file as arrays parsed from chunks of roughly
+    chunk_size bytes so that files of any size can be processed
+    """
+
+    rest = b""
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            # Leave the number which got cut in half for the next chunk
+            buffer = rest + chunk
+            end = buffer.rfind(b"\n") + 1
+            data, rest = buffer[:end], buffer[end:]
+            if data:
+                yield np.fromstring(data, dtype=np.int64, sep=" ")
+    if rest.strip():
+        yield np.fromstring(rest, dtype=np.int64, sep=" ")
+
+
+def fuel_for_masses(masses: np.ndarray) -> Tuple[int, int]:
+    """
+    Returns the fuel required by the modules and the fuel required once the
+    fuel itself is accounted for too. The fuel is computed for every module
+    at once, dropping the modules which need no more fuel as it goes.
+    """
+
+    fuel = masses // 3 - 2
+    direct = int(fuel.sum())
+
+    total = 0
+    fuel = fuel[fuel > 0]
+    while fuel.size:
+        total += int(fuel.sum())
+        fuel = fuel // 3 - 2
+        fuel = fuel[fuel > 0]
+
+    return direct, total
+
+
 if __name__ == "__main__":
 
-    with open(os.path.join("inputs", "day1.in")) as f:
-        module_masses = [int(line) for line in f.readlines()]
+    fuel = 0
+    total_fuel = 0
+    for masses in read_masses(os.path.join("inputs", "day1.in")):
+        direct, total = fuel_for_masses(masses)
+        fuel += direct
+        total_fuel += total
 
     # First part
-    assert sum(fuel_required(m) for m in module_masses) == 3382136
+    assert fuel == 3382136
 
     # Second part
-    assert sum(total_fuel_required(fuel_required(m)) for m in module_masses) == 5070314
+    assert total_fuel == 5070314
@@ -2,10 +2,26 @@ from __future__ import annotations
 import os
 import math
 import collections
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
 from operator import itemgetter
-from typing import List, DefaultDict, Tuple, Set, Dict
+from typing import List, DefaultDict, Tuple, Dict, Optional
 from dataclasses import dataclass
 
+# Stations handled at once by a single set of array operations
+BLOCK_SIZE = 64
+
+# Maps with fewer asteroids than this are not worth starting processes for
+PARALLEL_THRESHOLD = 2000
+
+# Greatest common divisors are looked up in a table rather than computed for
+# maps no wider or taller than this
+DIVISOR_TABLE_LIMIT = 2048
+
+# The asteroids and divisor table of each worker process
+_asteroids: Optional[np.ndarray] = None
+_divisors: Optional[np.ndarray] = None
+
 
 @dataclass
 class Vector:
@@ -46,17 +62,82 @@ def parse_asteroids(grid: List[List[str]]) -> List[Vector]:
     return asteroids
 
 
-def count_visible_asteroids(origin: Vector, asteroids: List[Vector]) -> int:
+def count_visible(
+    asteroids: np.ndarray,
+    start: int,
+    stop: int,
+    divisors: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    """
+    Counts how many asteroids are visible from each of the asteroids from
+    start to stop, which is the number of distinct directions from it to
+    the other asteroids once those are reduced by their greatest common
+    divisor. divisors[i, j] is the greatest common divisor of i and j.
+    """
+
+    stations = asteroids[start:stop]
+    dx = asteroids[:, 0] - stations[:, 0, np.newaxis]
+    dy = asteroids[:, 1] - stations[:, 1, np.newaxis]
+    if divisors is None:
+        divisor = np.gcd(dx, dy)
+    else:
+        divisor = divisors[np.abs(dx), np.abs(dy)]
+
+    # Encode every reduced direction as a single integer, with the station
+    # itself getting a key of its own which is not counted
+    itself = divisor == 0
+    divisor[itself] = 1
+    span = 2 * int(np.abs(asteroids).max()) + 1
+    keys = (dx // divisor) * span + dy // divisor
+    keys[itself] = span * span
+
+    keys.sort(axis=1)
+    return (np.diff(keys, axis=1) != 0).sum(axis=1)
+
+
+def _initialize(asteroids: np.ndarray, divisors: Optional[np.ndarray]) -> None:
+
+    global _asteroids, _divisors
+    _asteroids = asteroids
+    _divisors = divisors
 
-    visible: Set[Tuple[int, int]] = set()
-    for asteroid in asteroids:
-        if asteroid != origin:
-            direction = Vector(
-                asteroid.x - origin.x, asteroid.y - origin.y
-            ).normalized()
-            visible.add((direction.x, direction.y))
 
-    return len(visible)
+def _count_block(block: Tuple[int, int]) -> np.ndarray:
+
+    assert _asteroids is not None
+    return count_visible(_asteroids, *block, _divisors)
+
+
+def visibility(asteroids: List[Vector], workers: Optional[int] = None) -> List[int]:
+    """
+    Number of asteroids visible from every asteroid. Stations are processed
+    in blocks which are split between a pool of processes for large maps.
+    """
+
+    positions = np.array([(a.x, a.y) for a in asteroids], dtype=np.int64)
+    positions -= positions.min(axis=0)
+
+    divisors = None
+    extent = int(positions.max()) + 1
+    if extent <= DIVISOR_TABLE_LIMIT:
+        steps = np.arange(extent, dtype=np.int32)
+        divisors = np.gcd.outer(steps, steps)
+
+    blocks = [
+        (start, min(start + BLOCK_SIZE, len(asteroids)))
+        for start in range(0, len(asteroids), BLOCK_SIZE)
+    ]
+
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(asteroids) < PARALLEL_THRESHOLD:
+        counts = [count_visible(positions, *block, divisors) for block in blocks]
+    else:
+        with ProcessPoolExecutor(
+            max_workers=workers, initializer=_initialize, initargs=(positions, divisors)
+        ) as executor:
+            counts = list(executor.map(_count_block, blocks))
+
+    return [int(count) for count in np.concatenate(counts)]
 
 
 def group_asteroids(station: Vector, asteroids: List[Vector]) -> DefaultDict:
@@ -87,11 +168,9 @@ if __name__ == "__main__":
 
     # First part
     asteroids = parse_asteroids(grid)
-    visibility = [
-        (asteroid, count_visible_asteroids(asteroid, asteroids))
-        for asteroid in asteroids
-    ]
-    station, visible = max(visibility, key=itemgetter(1))
+    station, visible = max(
+        zip(asteroids, visibility(asteroids)), key=itemgetter(1)
+    )
     assert station == Vector(29, 28)
     assert visible == 256
 
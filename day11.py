@@ -3,10 +3,11 @@ from __future__ import annotations
 import os
 import collections
 from vm import Machine
+from image import load_program
 from dataclasses import dataclass
 from enum import IntEnum, unique
 from operator import attrgetter
-from typing import List, DefaultDict
+from typing import DefaultDict, Sequence
 
 
 Vector = collections.namedtuple("Vector", ["x", "y"])
@@ -53,15 +54,14 @@ class Robot:
 
 
 def paint_panels(
-    program: List[int], starting_panel: Panel
+    program: Sequence[int], starting_panel: Panel
 ) -> DefaultDict[Vector, Panel]:
 
     robot = Robot()
     panels: DefaultDict[Vector, Panel] = collections.defaultdict(lambda: Panel.BLACK)
 
     panels[robot.pos] = starting_panel
-    input_stream: List[int] = [panels[robot.pos]]
-    machine = Machine(program, input_stream, pause_on_output=True)
+    machine = Machine(program, [panels[robot.pos]], pause_on_output=True)
 
     while not machine.halted:
 
@@ -80,15 +80,14 @@ def paint_panels(
         else:
             robot.turn_right()
 
-        input_stream.append(panels[robot.pos])
+        machine.inputs.append(panels[robot.pos])
 
     return panels
 
 
 if __name__ == "__main__":
 
-    with open(os.path.join("inputs", "day11.in")) as f:
-        program = [int(byte) for byte in f.read().strip().split(",")]
+    program = load_program(os.path.join("inputs", "day11.in"))
 
     # First part
     panels = paint_panels(program, Panel.BLACK)
@@ -1,7 +1,9 @@
 import os
+from dataclasses import dataclass, field
 from enum import IntEnum, unique
-from vm import Machine
-from typing import Tuple, Dict
+from vm import Machine, Channel
+from image import load_program
+from typing import List, Tuple, Dict
 
 
 @unique
@@ -20,6 +22,30 @@ class Tile(IntEnum):
 Pixels = Dict[Tuple[int, int], Tile]
 
 
+@dataclass
+class Screen:
+
+    pixels: Pixels = field(default_factory=dict)
+    score: int = 0
+    ball: int = 0
+    paddle: int = 0
+
+    def update(self, instruction: List[int]) -> None:
+
+        x, y, tile = instruction
+
+        # Special score instruction
+        if (x, y) == (-1, 0):
+            self.score = tile
+            return
+
+        if tile == Tile.BALL:
+            self.ball = x
+        elif tile == Tile.PADDLE:
+            self.paddle = x
+        self.pixels[(x, y)] = Tile(tile)
+
+
 def draw(pixels: Pixels, score: int) -> None:
 
     for y in range(22 + 1):
@@ -32,71 +58,33 @@ def draw(pixels: Pixels, score: int) -> None:
 
 if __name__ == "__main__":
 
-    with open(os.path.join("inputs", "day13.in")) as f:
-        program = [int(instr) for instr in f.read().strip().split(",")]
+    program = load_program(os.path.join("inputs", "day13.in"))
 
-    # First part
-    machine = Machine(program, [])
+    # First part - the game draws three values at a time
+    screen = Screen()
+    machine = Machine(program, [], output=Channel(maxlen=3, consumer=screen.update))
     machine.execute()
 
-    output = machine.output[:]
-    pixels: Pixels = {}
-
-    while output:
-        x, y, tile = output[:3]
-
-        # Special score instruction
-        if x == -1 and y == 0:
-            continue
-
-        output = output[3:]
-        pixels[(x, y)] = Tile(tile)
-
-    assert sum(1 for tile in pixels.values() if tile is Tile.BLOCK) == 361
+    assert sum(1 for tile in screen.pixels.values() if tile is Tile.BLOCK) == 361
 
     # Second part
-    machine = Machine(program, [], wait_for_input=True)
+    screen = Screen()
+    machine = Machine(program, [], output=Channel(maxlen=3, consumer=screen.update))
     machine.memory[0] = 2
 
-    pixels = {}
-    score = 0
-
     # First draw until input is requested so that all tiles are visible
     machine.execute()
-
-    while machine.output:
-        x, y, tile = machine.output[:3]
-        if (x, y) == (-1, 0):
-            score = tile
-        else:
-            pixels[(x, y)] = Tile(tile)
-        machine.output = machine.output[3:]
-
-    draw(pixels, score)
+    draw(screen.pixels, screen.score)
 
     # Start playing the game
     machine.inputs.append(0)
-    ball = 0
-    paddle = 0
-    player_input = 0
 
     while not machine.halted:
         machine.execute()
-        while machine.output:
-            x, y, tile = machine.output[:3]
-            if (x, y) == (-1, 0):
-                score = tile
-            else:
-                if tile == Tile.BALL:
-                    ball = x
-                elif tile == Tile.PADDLE:
-                    paddle = x
-                pixels[(x, y)] = Tile(tile)
-            machine.output = machine.output[3:]
 
         # Simply move the paddle towards the ball
-        player_input = -1 if ball < paddle else 1
+        player_input = -1 if screen.ball < screen.paddle else 1
 
         machine.inputs.append(player_input)
 
-    assert score == 17590
+    assert screen.score == 17590
@@ -3,10 +3,11 @@ import time
 import collections
 from enum import IntEnum
 from vm import Machine
-from typing import Optional, DefaultDict, Deque, Tuple, Set
+from image import load_program
+from grid import Grid, distances
+from typing import Deque, Tuple
 
 Vec = collections.namedtuple("Vec", ["x", "y"])
-Grid = DefaultDict[Vec, str]
 direction_map = {1: Vec(0, -1), 2: Vec(0, 1), 3: Vec(-1, 0), 4: Vec(1, 0)}
 
 
@@ -18,135 +19,102 @@ class Direction(IntEnum):
     EAST = 4
 
 
-def explore(
-    position: Vec, previous: Optional[Vec], machine: Machine, grid: Grid
-) -> None:
+class Tile(IntEnum):
 
-    machine.execute()
-    tile = machine.output[-1]
-
-    # Ran into a wall - terminate recursion
-    if tile == 0:
-        grid[position] = "#"
-        return
-    elif tile == 1:
-        grid[position] = "."
-    else:
-        grid[position] = "o"
-
-    # Draw the grid
-    if os.getenv("PRETTY_AOC"):
-        os.system("clear")
-        draw_grid(grid, position)
-        time.sleep(0.01)
+    UNKNOWN = 0
+    WALL = 1
+    OPEN = 2
+    OXYGEN = 3
 
-    for d in Direction:
-        vec = direction_map[d]
 
-        next_position = Vec(position.x + vec.x, position.y + vec.y)
-        if next_position != previous:
+tile_map = {Tile.UNKNOWN: " ", Tile.WALL: "#", Tile.OPEN: ".", Tile.OXYGEN: "o"}
 
-            # Step to the direction
-            machine.inputs.append(d)
-            explore(next_position, position, machine, grid)
 
-            # Now reverse back again
-            if grid[next_position] != "#":
-                reverse_d = {1: 2, 2: 1, 3: 4, 4: 3}[d]
-                machine.inputs.append(reverse_d)
-                machine.execute()
+def explore(droid: Machine) -> Grid:
 
+    grid = Grid(Tile.UNKNOWN)
+    grid[Vec(0, 0)] = Tile.OPEN
 
-def distance_to_oxygen(grid: Grid, start_pos: Vec) -> int:
-
-    queue: Deque[Tuple[int, Vec]] = collections.deque([(1, start_pos)])
-    visited: Set[Vec] = set()
+    # Map the ship using breadth-first search where each step forks the droid
+    # from the state it was in on the previous tile instead of backtracking
+    queue: Deque[Tuple[Vec, Machine]] = collections.deque([(Vec(0, 0), droid)])
 
     while queue:
 
-        distance, pos = queue.popleft()
+        position, machine = queue.popleft()
 
-        if grid[pos] == "o":
-            return distance
-        elif grid[pos] == "#":
-            continue
+        for d in Direction:
+            vec = direction_map[d]
+            next_position = Vec(position.x + vec.x, position.y + vec.y)
+            if grid[next_position] != Tile.UNKNOWN:
+                continue
 
-        visited.add(pos)
+            moved = machine.fork()
+            moved.inputs.append(d)
+            moved.execute()
+            tile = moved.output.pop()
 
-        for vec in direction_map.values():
-            next_pos = Vec(pos.x + vec.x, pos.y + vec.y)
-            if next_pos not in visited:
-                queue.append((distance + 1, next_pos))
+            if tile == 0:
+                grid[next_position] = Tile.WALL
+                continue
+            grid[next_position] = Tile.OPEN if tile == 1 else Tile.OXYGEN
+            queue.append((next_position, moved))
 
-    return -1
+        # Draw the grid
+        if os.getenv("PRETTY_AOC"):
+            os.system("clear")
+            draw_grid(grid, position)
+            time.sleep(0.01)
 
+    return grid
 
-def minutes_for_oxygen_to_spread(grid: Grid, oxygen_pos: Vec) -> int:
 
-    queue: Deque[Tuple[int, Vec]] = collections.deque([(0, oxygen_pos)])
-    visited: Set[Vec] = set()
+def oxygen_distances(grid: Grid) -> Tuple[int, int]:
+    """
+    Spreads oxygen from the oxygen system through the whole ship in a single
+    breadth-first search. Returns how long it takes to reach the starting
+    point and how long it takes to reach every point.
+    """
 
-    while queue:
-
-        minutes, pos = queue.popleft()
-        visited.add(pos)
-
-        for vec in direction_map.values():
-            next_pos = Vec(pos.x + vec.x, pos.y + vec.y)
-            if next_pos not in visited and grid[next_pos] != "#":
-                queue.append((minutes + 1, next_pos))
-
-    return minutes
+    field = distances(grid, grid.find(Tile.OXYGEN), (Tile.OPEN, Tile.OXYGEN))
+    return field[grid.index(Vec(0, 0))], max(field)
 
 
 def draw_grid(grid: Grid, position: Vec) -> None:
 
-    ys = [vec.y for vec in sorted(grid.keys(), key=lambda pos: pos.y)]
-    xs = [vec.x for vec in sorted(grid.keys(), key=lambda pos: pos.x)]
+    left, top, right, bottom = grid.bounds()
 
-    for y in range(ys[0], ys[-1] + 1):
+    for y in range(top, bottom):
         row = []
-        for x in range(xs[0], xs[-1] + 1):
+        for x in range(left, right):
             if Vec(x, y) == position:
                 row.append("x")
             elif Vec(x, y) == Vec(0, 0):
                 row.append("s")
             else:
-                row.append(grid[Vec(x, y)])
+                row.append(tile_map[Tile(grid[Vec(x, y)])])
         print("".join(row))
 
 
 if __name__ == "__main__":
 
-    with open(os.path.join("inputs", "day15.in")) as f:
-        program = [int(instr) for instr in f.read().strip().split(",")]
+    program = load_program(os.path.join("inputs", "day15.in"))
 
     # First part
-    machine = Machine(program, [], wait_for_input=True)
+    machine = Machine(program, [])
     machine.execute()
 
-    grid: Grid = collections.defaultdict(lambda: " ")
-
-    # First map the unknown part of the ship using depth-first search
-    machine.inputs.append(Direction.SOUTH)
+    # First map the unknown part of the ship
     start_pos = Vec(0, 0)
-    explore(start_pos, None, machine, grid)
+    grid = explore(machine)
 
     os.system("clear")
     draw_grid(grid, start_pos)
 
-    # Now that the map is known use breadth-first search to find the shortest path
-    distance = distance_to_oxygen(grid, start_pos)
+    # Now that the map is known a single breadth-first search from the oxygen
+    # system answers both how far away it is and how long it takes to spread
+    distance, minutes = oxygen_distances(grid)
     assert distance == 300
 
     # Second part
-    oxygen_pos = None
-    for pos, point in grid.items():
-        if point == "o":
-            oxygen_pos = pos
-            break
-    assert oxygen_pos is not None
-
-    # Use breadth-first search again to find the path to the most distant point
-    minutes = minutes_for_oxygen_to_spread(grid, oxygen_pos)
     assert minutes == 312
@@ -1,14 +1,22 @@
 import os
+import functools
 import collections
 from operator import attrgetter
-from typing import List, DefaultDict
+from typing import DefaultDict, Iterable, List, Optional, Tuple
 
-from vm import Machine
+from vm import Machine, Channel
+from image import load_program
 
 Vec = collections.namedtuple("Vec", ["x", "y"])
 
+# A turn followed by the number of steps taken forward, like ("L", 12). The
+# first move can also go straight ahead without turning or turn around.
+Move = Tuple[str, int]
 
-def create_grid(data: List[int]) -> DefaultDict[Vec, str]:
+DIRECTIONS = {"^": Vec(0, -1), "v": Vec(0, 1), "<": Vec(-1, 0), ">": Vec(1, 0)}
+
+
+def create_grid(data: Iterable[int]) -> DefaultDict[Vec, str]:
 
     grid: DefaultDict[Vec, str] = collections.defaultdict(str)
 
@@ -54,40 +62,131 @@ def alignment_paremeter_sum(grid: DefaultDict[Vec, str]) -> int:
     return sum(vec.x * vec.y for vec in intersections)
 
 
+def scaffold_path(grid: DefaultDict[Vec, str]) -> List[Move]:
+    """
+    Walks the scaffold from the robot to its far end, always going straight
+    through intersections, and returns the turns and steps it took
+    """
+
+    position, facing = next(
+        (vec, DIRECTIONS[cell]) for vec, cell in grid.items() if cell in DIRECTIONS
+    )
+
+    def scaffold(vec: Vec) -> bool:
+        # Lookups must not add cells to the grid
+        return grid.get(vec) == "#"
+
+    def turns(facing: Vec) -> List[Tuple[str, Vec]]:
+        return [("L", Vec(facing.y, -facing.x)), ("R", Vec(-facing.y, facing.x))]
+
+    back = Vec(-facing.x, -facing.y)
+    options = [("", facing), *turns(facing), ("R,R", back)]
+
+    moves: List[Move] = []
+    while True:
+        for turn, direction in options:
+            if scaffold(Vec(position.x + direction.x, position.y + direction.y)):
+                facing = direction
+                break
+        else:
+            return moves
+        options = turns(facing)
+
+        steps = 0
+        while scaffold(Vec(position.x + facing.x, position.y + facing.y)):
+            position = Vec(position.x + facing.x, position.y + facing.y)
+            steps += 1
+        moves.append((turn, steps))
+
+
+def encode(moves: Tuple[Move, ...]) -> str:
+    return ",".join(f"{turn},{steps}" if turn else str(steps) for turn, steps in moves)
+
+
+def compress(
+    moves: List[Move], functions: int = 3, limit: int = 20
+) -> Optional[Tuple[str, List[str]]]:
+    """
+    Splits the path into a main routine which calls at most the given number
+    of movement functions so that neither the routine nor any function is
+    longer than limit characters. Returns the routine and the functions or
+    None if the path can not be split that way.
+    """
+
+    path = tuple(moves)
+    # Every call takes up a name and a comma in the main routine
+    calls = (limit + 1) // 2
+
+    Function = Tuple[Move, ...]
+
+    @functools.lru_cache(maxsize=None)
+    def search(
+        position: int, defined: Tuple[Function, ...], depth: int
+    ) -> Optional[Tuple[Tuple[int, ...], Tuple[Function, ...]]]:
+
+        if position == len(path):
+            return (), defined
+        if depth == calls:
+            return None
+
+        candidates = list(enumerate(defined))
+        if len(defined) < functions:
+            # A new function starts where the path currently is and grows
+            # until it does not fit anymore, longest first since those
+            # leave the least of the path to cover
+            fitting = []
+            for end in range(position + 1, len(path) + 1):
+                if len(encode(path[position:end])) > limit:
+                    break
+                fitting.append((len(defined), path[position:end]))
+            candidates.extend(reversed(fitting))
+
+        for index, function in candidates:
+            if path[position : position + len(function)] != function:
+                continue
+            known = defined if index < len(defined) else defined + (function,)
+            found = search(position + len(function), known, depth + 1)
+            if found is not None:
+                routine, bodies = found
+                return (index,) + routine, bodies
+        return None
+
+    found = search(0, (), 0)
+    if found is None:
+        return None
+    routine, bodies = found
+    return (
+        ",".join("ABCDEFGHIJ"[index] for index in routine),
+        [encode(body) for body in bodies],
+    )
+
+
 if __name__ == "__main__":
 
-    with open(os.path.join("inputs", "day17.in")) as f:
-        program = [int(instruction) for instruction in f.read().strip().split(",")]
+    program = load_program(os.path.join("inputs", "day17.in"))
 
     # First part - visualize the grid and find intersections
-    machine = Machine(program, [], wait_for_input=True)
+    machine = Machine(program, [])
     machine.execute()
 
     grid = create_grid(machine.output)
     assert alignment_paremeter_sum(grid) == 3292
 
-    # Second part - apply movement functions deciphered by hand
-    machine = Machine([2] + program[1:], [])
+    # Second part - walk the scaffold and split the path into movement
+    # functions the robot can fit in its memory
+    compressed = compress(scaffold_path(grid))
+    assert compressed is not None
+    movement_routine, movement_functions = compressed
 
-    movement_routine = "A,B,A,C,A,B,C,B,C,A\n"
-    movement_functions = [
-        "L,12,R,4,R,4,L,6\n",
-        "L,12,R,4,R,4,R,12\n",
-        "L,10,L,6,R,4\n",
-    ]
-
-    for routine in movement_routine:
-        machine.inputs.append(ord(routine))
-
-    for function in movement_functions:
-        for command in function:
-            machine.inputs.append(ord(command))
+    # The robot always reads three functions even when fewer are called
+    movement_functions += movement_functions[-1:] * (3 - len(movement_functions))
 
     # No visualization thank you
-    machine.inputs.append(ord("n"))
-    machine.inputs.append(ord("\n"))
+    commands = "\n".join([movement_routine, *movement_functions, "n", ""])
 
-    while not machine.halted:
-        machine.execute()
+    # Only the dust count at the very end is interesting
+    machine = Machine(program, (ord(c) for c in commands), output=Channel(maxlen=1))
+    machine.memory[0] = 2
+    machine.execute()
 
     assert machine.output[-1] == 651043
@@ -1,31 +1,43 @@
 import os
-from typing import List
 from vm import Machine
+from batch import BatchMachine
+from image import load_program
+from cache import RunCache
 
 
-def point_in_beam(program: List[int], x: int, y: int) -> bool:
+def point_in_beam(drone: Machine, x: int, y: int) -> bool:
 
-    machine = Machine(program, [x, y])
+    machine = drone.spawn([x, y])
     machine.execute()
     return bool(machine.output[0])
 
 
 if __name__ == "__main__":
 
-    with open(os.path.join("inputs", "day19.in")) as f:
-        program = [int(opcode) for opcode in f.read().strip().split(",")]
+    code = load_program(os.path.join("inputs", "day19.in"))
 
-    # First part - just apply brute force and iterate over all the points
-    points_affected = 0
-    for y in range(0, 50):
-        for x in range(0, 50):
-            if point_in_beam(program, x, y):
-                points_affected += 1
+    # First part - just apply brute force and probe all the points at once
+    drones = BatchMachine.from_program(
+        code, [[x, y] for y in range(0, 50) for x in range(0, 50)]
+    )
+    drones.execute()
+    points_affected = int(drones.output[:, 0].sum())
     assert points_affected == 121
 
     # Second part - find the position of the square by locating the closest
     # point (x, y) inside the beam for which the point (x + 99, y - 99)
     # is also inside the beam. Those two points form the closest square.
+    # Every probe starts from a drone which has already run up to the point
+    # where it asks for the coordinates, which on this input saves a single
+    # instruction per probe
+    drone = Machine.template(code)
+    assert drone.cycles == 1
+
+    # Probes are pure so they are cached, and setting INTCODE_CACHE to a
+    # directory keeps them on disk so a repeated search can skip the VM
+    cache = RunCache(directory=os.environ.get("INTCODE_CACHE"))
+    probe = cache.memoize(point_in_beam)
+
     previous_x = 0
     top_left = None
 
@@ -35,7 +47,7 @@ if __name__ == "__main__":
             break
 
         for x in range(previous_x, 10_000):
-            if point_in_beam(program, x, y):
+            if probe(drone, x, y):
 
                 # The beam will start more to the right on the next row
                 # so then you can skip the first (previous_x - 1) points
@@ -44,7 +56,7 @@ if __name__ == "__main__":
                 # The point 100 points to the right and 100 points above
                 # is inside the beam so this position is the bottom-left
                 # corner of the square
-                if y >= 100 and point_in_beam(program, x + 99, y - 99):
+                if y >= 100 and probe(drone, x + 99, y - 99):
                     top_left = (x, y - 99)
                     break
                 break
@@ -1,27 +1,38 @@
 import os
-import sys
+import numpy as np
+from typing import Sequence
 from vm import Machine
+from batch import BatchMachine
+from image import load_program
+from cache import RunCache
+
+
+def run(program: Sequence[int], noun: int, verb: int) -> int:
+
+    machine = Machine(program, [])
+    machine.memory[1] = noun
+    machine.memory[2] = verb
+    machine.execute()
+    return machine.memory[0]
 
 
 if __name__ == "__main__":
 
-    with open(os.path.join("inputs", "day2.in")) as f:
-        program = [int(code) for code in f.read().split(",")]
+    program = load_program(os.path.join("inputs", "day2.in"))
+
+    # Runs only depend on the noun and the verb so they can be cached
+    cache = RunCache()
+    cached_run = cache.memoize(run)
 
     # First part
-    modified_program = program[:1] + [12, 2] + program[3:]
-    machine = Machine(modified_program, [])
-    machine.execute()
-    assert machine.memory[0] == 3409710
-
-    # Second part
-    for noun in range(100):
-        for verb in range(100):
-            modified_program = program[:1] + [noun, verb] + program[3:]
-            machine = Machine(modified_program, [])
-            machine.execute()
-            if machine.memory[0] == 19690720:
-                assert 100 * noun + verb == 7912
-                sys.exit()
-
-    assert False
+    assert cached_run(program, 12, 2) == 3409710
+
+    # Second part - run every noun and verb pair at once in lockstep
+    pairs = np.array([(noun, verb) for noun in range(100) for verb in range(100)])
+    machines = BatchMachine.from_program(program, [[] for _ in pairs])
+    machines.memory[:, 1:3] = pairs
+    machines.execute()
+
+    noun, verb = pairs[machines.memory[:, 0] == 19690720][0]
+    assert 100 * noun + verb == 7912
+    assert cached_run(program, int(noun), int(verb)) == 19690720
@@ -1,52 +1,154 @@
 import os
+import bisect
+import itertools
 import collections
-from typing import List, Set, Dict
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Tuple
 
 
 Vec = collections.namedtuple("Vec", ["x", "y"])
 
+# Map of direction literals to vectors
+vecs = {"U": Vec(0, 1), "R": Vec(1, 0), "D": Vec(0, -1), "L": Vec(-1, 0)}
+
+
+@dataclass(frozen=True)
+class Segment:
+
+    wire: int
+    start: Vec
+    end: Vec
+    # Steps the wire has taken to reach the start of the segment
+    steps: int
+
+    @property
+    def horizontal(self) -> bool:
+        return self.start.y == self.end.y
+
+    def steps_to(self, point: Vec) -> int:
+        return self.steps + abs(point.x - self.start.x) + abs(point.y - self.start.y)
+
+
+@dataclass(frozen=True)
+class Crossing:
+
+    point: Vec
+    wires: Tuple[int, int]
+    # Combined steps both wires take to reach the point
+    steps: int
+
+
+def segments(wire: int, path: List[str]) -> List[Segment]:
+
+    result = []
+    pos = Vec(0, 0)
+    steps = 0
+    for move in path:
+        vec, length = vecs[move[0]], int(move[1:])
+        end = Vec(pos.x + vec.x * length, pos.y + vec.y * length)
+        if length:
+            result.append(Segment(wire, pos, end, steps))
+        pos = end
+        steps += length
+    return result
+
+
+def crossing(a: Segment, b: Segment, point: Vec) -> Crossing:
+    return Crossing(point, (a.wire, b.wire), a.steps_to(point) + b.steps_to(point))
+
+
+def perpendicular(wires: List[List[Segment]]) -> Iterator[Crossing]:
+    """
+    Finds where horizontal and vertical segments of different wires cross by
+    sweeping a vertical line from left to right over the segments. The line
+    keeps the horizontal segments it currently crosses sorted by height so
+    every vertical segment only looks at the ones within its own span.
+    """
+
+    horizontal = [s for wire in wires for s in wire if s.horizontal]
+    vertical = [s for wire in wires for s in wire if not s.horizontal]
+
+    # Segments entering the line come before those on it, which come before
+    # those leaving it, so that segments which merely touch still cross
+    events: List[Tuple[int, int, int]] = []
+    for i, s in enumerate(horizontal):
+        events.append((min(s.start.x, s.end.x), 0, i))
+        events.append((max(s.start.x, s.end.x), 2, i))
+    for i, s in enumerate(vertical):
+        events.append((s.start.x, 1, i))
+    events.sort()
+
+    active: List[Tuple[int, int]] = []
+    for x, kind, i in events:
+        if kind == 0:
+            bisect.insort(active, (horizontal[i].start.y, i))
+        elif kind == 2:
+            del active[bisect.bisect_left(active, (horizontal[i].start.y, i))]
+        else:
+            v = vertical[i]
+            low, high = sorted((v.start.y, v.end.y))
+            first = bisect.bisect_left(active, (low, -1))
+            last = bisect.bisect_right(active, (high, len(horizontal)))
+            for y, j in active[first:last]:
+                h = horizontal[j]
+                if h.wire != v.wire:
+                    yield crossing(h, v, Vec(x, y))
+
+
+def collinear(wires: List[List[Segment]]) -> Iterator[Crossing]:
+    """
+    Finds where segments of different wires run on top of each other. Only
+    the points of an overlap which can be closest to the origin or take the
+    fewest steps to reach are reported, which are its ends and the points
+    around the origin, since both distances change linearly along it.
+    """
+
+    lines: Dict[Tuple[bool, int], List[Segment]] = collections.defaultdict(list)
+    for wire in wires:
+        for s in wire:
+            lines[(s.horizontal, s.start.y if s.horizontal else s.start.x)].append(s)
+
+    def span(s: Segment) -> Tuple[int, int]:
+        if s.horizontal:
+            return min(s.start.x, s.end.x), max(s.start.x, s.end.x)
+        return min(s.start.y, s.end.y), max(s.start.y, s.end.y)
+
+    for (horizontal, line), on_line in lines.items():
+        on_line.sort(key=span)
+        for i, a in enumerate(on_line):
+            a_low, a_high = span(a)
+            for b in on_line[i + 1 :]:
+                b_low, b_high = span(b)
+                if b_low > a_high:
+                    break
+                if a.wire == b.wire:
+                    continue
+                low, high = b_low, min(a_high, b_high)
+                around = (min(max(p, low), high) for p in (-1, 0, 1))
+                for offset in {low, high, *around}:
+                    point = Vec(offset, line) if horizontal else Vec(line, offset)
+                    yield crossing(a, b, point)
+
+
+def crossings(paths: List[List[str]]) -> List[Crossing]:
+
+    wires = [segments(wire, path) for wire, path in enumerate(paths)]
+    origin = Vec(0, 0)
+    found = itertools.chain(perpendicular(wires), collinear(wires))
+    return [c for c in found if c.point != origin]
+
 
 if __name__ == "__main__":
 
     with open(os.path.join("inputs", "day3.in")) as f:
         wires = [line.strip().split(",") for line in f.readlines()]
 
-    # Map of direction literals to vectors
-    vecs = {"U": Vec(0, 1), "R": Vec(1, 0), "D": Vec(0, -1), "L": Vec(-1, 0)}
-    # Sets of points formed by the two wires
-    points: List[Set] = [set() for _ in wires]
-    # Map how many steps it takes to reach a point
-    steps: List[Dict[Vec, int]] = [{} for _ in wires]
-
-    origin = Vec(0, 0)
-
-    for i, wire in enumerate(wires):
-
-        step = 0
-        pos = origin
-
-        for path in wire:
-
-            direction, length = path[0], int(path[1:])
-
-            for l in range(1, length + 1):
-                current = Vec(
-                    pos.x + vecs[direction].x * l, pos.y + vecs[direction].y * l,
-                )
-                points[i].add(current)
-                step += 1
-                steps[i][current] = step
-
-            pos = current
-
-    crosses = points[0] & points[1]
+    crosses = crossings(wires)
 
     # First part
-    closest_manhattan = sorted(
-        [abs(origin.x - c.x) + abs(origin.y - c.y) for c in crosses]
-    )[0]
+    closest_manhattan = min(abs(c.point.x) + abs(c.point.y) for c in crosses)
     assert closest_manhattan == 1431
 
     # Second part
-    closest_step = sorted([steps[0][c] + steps[1][c] for c in crosses])[0]
+    closest_step = min(c.steps for c in crosses)
     assert closest_step == 48012
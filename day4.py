@@ -1,6 +1,96 @@
 import os
-from collections import Counter
-from typing import List
+import functools
+import itertools
+from typing import Iterator, Tuple
+
+
+def is_password(number: int, exact: bool = False) -> bool:
+
+    digits = str(number)
+    runs = [len(list(run)) for _, run in itertools.groupby(digits)]
+    if list(digits) != sorted(digits):
+        return False
+    return 2 in runs if exact else max(runs) >= 2
+
+
+def count_up_to(number: int) -> Tuple[int, int]:
+    """
+    Counts the passwords from 1 to number whose digits never decrease and
+    which contain some pair of adjacent equal digits, and those containing
+    a pair which is not part of a larger group, using dynamic programming
+    over the digits of number
+    """
+
+    if number < 1:
+        return 0, 0
+    digits = [int(digit) for digit in str(number)]
+
+    @functools.lru_cache(maxsize=None)
+    def count(
+        position: int, last: int, run: int, pair: bool, exact: bool, tight: bool
+    ) -> Tuple[int, int]:
+
+        if position == len(digits):
+            if not last:
+                return 0, 0
+            return int(pair or run >= 2), int(exact or run == 2)
+
+        highest = digits[position] if tight else 9
+        pairs = exacts = 0
+
+        # Leading zeroes make for numbers with fewer digits
+        if not last:
+            pairs, exacts = count(position + 1, 0, 0, False, False, False)
+
+        for digit in range(max(last, 1), highest + 1):
+            if digit == last:
+                # The length of a run only matters up to three
+                state = (digit, min(run + 1, 3), pair, exact)
+            else:
+                state = (digit, 1, pair or run >= 2, exact or run == 2)
+            found = count(position + 1, *state, tight and digit == highest)
+            pairs += found[0]
+            exacts += found[1]
+
+        return pairs, exacts
+
+    return count(0, 0, 0, False, False, True)
+
+
+def count_passwords(low: int, high: int) -> Tuple[int, int]:
+    """Counts the passwords between low and high under both rules"""
+
+    upper = count_up_to(high)
+    lower = count_up_to(low - 1)
+    return upper[0] - lower[0], upper[1] - lower[1]
+
+
+def passwords(low: int, high: int, exact: bool = False) -> Iterator[int]:
+    """
+    Yields the passwords between low and high in increasing order. Only
+    numbers whose digits never decrease are ever generated, and prefixes
+    which can not lead to a number within the range are skipped.
+    """
+
+    def extend(prefix: int, last: int, remaining: int) -> Iterator[int]:
+
+        if not remaining:
+            if prefix >= low and is_password(prefix, exact):
+                yield prefix
+            return
+
+        scale = 10 ** (remaining - 1)
+        for digit in range(max(last, 1), 10):
+            start = (prefix * 10 + digit) * scale
+            smallest = start + digit * (scale - 1) // 9
+            if smallest > high:
+                break
+            if start + scale - 1 < low:
+                continue
+            yield from extend(prefix * 10 + digit, digit, remaining - 1)
+
+    for length in range(len(str(max(low, 1))), len(str(high)) + 1):
+        yield from extend(0, 0, length)
 
 
 if __name__ == "__main__":
@@ -8,17 +98,12 @@ if __name__ == "__main__":
     with open(os.path.join("inputs", "day4.in")) as f:
         low, high = [int(num) for num in f.read().strip().split("-")]
 
-    # First part
-    passwords: List[str] = []
-    for d in range(low, high + 1):
-        digit = str(d)
-
-        if len(set(digit)) < 6 and sorted(digit) == list(digit):
-            passwords.append(digit)
+    # Count the passwords matching the rules of both parts in one go
+    pairs, exact_pairs = count_passwords(low, high)
 
-    assert len(passwords) == 910
+    # First part
+    assert pairs == 910
 
     # Second part
-    stricter_passwords = [p for p in passwords if 2 in Counter(p).values()]
-
-    assert len(stricter_passwords) == 598
+    assert exact_pairs == 598
+    assert sum(1 for _ in passwords(low, high, exact=True)) == exact_pairs
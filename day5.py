@@ -1,11 +1,11 @@
 import os
 from vm import Machine
+from image import load_program
 
 
 if __name__ == "__main__":
 
-    with open(os.path.join("inputs", "day5.in")) as f:
-        program = [int(opcode) for opcode in f.read().strip().split(",")]
+    program = load_program(os.path.join("inputs", "day5.in"))
 
     # First part
     machine = Machine(program, [1])
@@ -1,75 +1,150 @@
 from __future__ import annotations
 import os
-import sys
+import collections
+import numpy as np
 from dataclasses import dataclass, field
-from typing import List, Dict
-
-
-# Let's go berserk
-sys.setrecursionlimit(2048)
+from typing import DefaultDict, Dict, Iterable, List, Sequence, Set, Tuple
 
 
 @dataclass
-class OrbitObject:
-
-    name: str
-    children: List[OrbitObject] = field(default_factory=list)
-    orbits: int = 0
-
-
-OrbitMap = Dict[str, OrbitObject]
-
+class OrbitTree:
+    """
+    Orbits as arrays indexed by object ids. ancestors[k][i] is the object
+    2^k steps closer to the center of mass than object i, or the object at
+    the very center if there is no such object, which is what lets common
+    ancestors be found with a logarithmic number of jumps.
+    """
+
+    names: List[str]
+    ids: Dict[str, int]
+    depths: np.ndarray
+    ancestors: np.ndarray
+
+    @classmethod
+    def build(cls, orbits: Sequence[Sequence[str]]) -> OrbitTree:
+
+        ids: Dict[str, int] = {}
+        names: List[str] = []
+        for target, orbiter in orbits:
+            for name in (target, orbiter):
+                if name not in ids:
+                    ids[name] = len(names)
+                    names.append(name)
+
+        # Objects which do not orbit anything are their own parents
+        parents = np.arange(len(names))
+        for target, orbiter in orbits:
+            parents[ids[orbiter]] = ids[target]
+
+        # Double the length of every jump until none of them lead anywhere
+        # new, adding up how many orbits each jump spans along the way
+        depths = (parents != np.arange(len(names))).astype(np.int64)
+        ancestors = [parents]
+        while True:
+            jump = ancestors[-1]
+            further = jump[jump]
+            if np.array_equal(further, jump):
+                break
+            depths = depths + depths[jump]
+            ancestors.append(further)
+
+        return cls(names, ids, depths, np.array(ancestors))
+
+    def checksum(self) -> int:
+        return int(self.depths.sum())
+
+    def parent(self, name: str) -> str:
+        return self.names[self.ancestors[0][self.ids[name]]]
+
+    def common_ancestor(self, first: str, second: str) -> str:
+
+        a, b = self.ids[first], self.ids[second]
+        if self.depths[a] < self.depths[b]:
+            a, b = b, a
+
+        # Bring both to the same depth first and then jump up as far as
+        # possible while staying below the common ancestor
+        difference = int(self.depths[a] - self.depths[b])
+        for k in range(difference.bit_length()):
+            if difference >> k & 1:
+                a = self.ancestors[k][a]
+        if a == b:
+            return self.names[a]
+
+        for k in reversed(range(len(self.ancestors))):
+            if self.ancestors[k][a] != self.ancestors[k][b]:
+                a, b = self.ancestors[k][a], self.ancestors[k][b]
+        if self.ancestors[0][a] != self.ancestors[0][b]:
+            raise Exception("No common ancestors found")
+        return self.names[self.ancestors[0][a]]
+
+    def distance(self, first: str, second: str) -> int:
+
+        ancestor = self.ids[self.common_ancestor(first, second)]
+        return int(
+            self.depths[self.ids[first]]
+            + self.depths[self.ids[second]]
+            - 2 * self.depths[ancestor]
+        )
 
-def map_orbits(orbits: List[List[str]]) -> OrbitMap:
 
-    orbit_map: OrbitMap = {}
-    for target, orbiter in orbits:
-        if target not in orbit_map:
-            orbit_map[target] = OrbitObject(target)
-        if orbiter not in orbit_map:
-            orbit_map[orbiter] = OrbitObject(orbiter)
-        orbit_map[target].children.append(orbit_map[orbiter])
-
-    return orbit_map
-
-
-def orbit_checksum(orbiter: OrbitObject, depth: int = 0) -> int:
-
-    if not orbiter:
-        return 0
+@dataclass
+class OrbitMap:
+    """
+    Orbits which can change over time. Every object knows how many objects
+    it orbits directly and indirectly and the checksum is kept up to date
+    as objects start orbiting something else or stop orbiting altogether.
+    An update only visits the objects orbiting the object which moved.
+    """
 
-    # Mutating the orbiter here is nasty but oh well
-    orbiter.orbits = depth
+    parents: Dict[str, str] = field(default_factory=dict)
+    children: DefaultDict[str, Set[str]] = field(
+        default_factory=lambda: collections.defaultdict(set)
+    )
+    depths: DefaultDict[str, int] = field(
+        default_factory=lambda: collections.defaultdict(int)
+    )
+    checksum: int = 0
 
-    return depth + sum(orbit_checksum(child, depth + 1) for child in orbiter.children)
+    def extend(self, orbits: Iterable[Tuple[str, str]]) -> None:
 
+        for target, orbiter in orbits:
+            self.attach(target, orbiter)
 
-def path_to(target: str, current: OrbitObject) -> List[OrbitObject]:
+    def attach(self, target: str, orbiter: str) -> None:
+        """Makes orbiter orbit target instead of whatever it orbited before"""
 
-    if not current:
-        return []
+        subtree = self.subtree(orbiter)
+        if target in subtree:
+            raise ValueError(f"{target} already orbits {orbiter}")
 
-    if current.name == target:
-        return [current]
+        if orbiter in self.parents:
+            self.children[self.parents[orbiter]].discard(orbiter)
+        self.parents[orbiter] = target
+        self.children[target].add(orbiter)
+        self.move(subtree, self.depths[target] + 1 - self.depths[orbiter])
 
-    for child in current.children:
-        path = path_to(target, child)
-        if path:
-            return [current] + path
+    def detach(self, orbiter: str) -> None:
+        """Makes orbiter stop orbiting anything"""
 
-    return []
+        if orbiter not in self.parents:
+            return
+        self.children[self.parents.pop(orbiter)].discard(orbiter)
+        self.move(self.subtree(orbiter), -self.depths[orbiter])
 
+    def subtree(self, root: str) -> List[str]:
+        """The object and every object orbiting it directly or indirectly"""
 
-def lowest_common_ancestor(root: OrbitObject, first: str, second: str) -> OrbitObject:
+        objects = [root]
+        for name in objects:
+            objects.extend(self.children.get(name, ()))
+        return objects
 
-    path_to_first = path_to(first, root)
-    path_to_second = path_to(second, root)
-    ancestors = set([node.name for node in path_to_first])
-    for ancestor in reversed(path_to_second):
-        if ancestor.name in ancestors:
-            return ancestor
+    def move(self, subtree: List[str], change: int) -> None:
 
-    raise Exception("No common ancestors found")
+        for name in subtree:
+            self.depths[name] += change
+        self.checksum += change * len(subtree)
 
 
 if __name__ == "__main__":
@@ -77,11 +152,15 @@ if __name__ == "__main__":
     with open(os.path.join("inputs", "day6.in")) as f:
         orbits = [line.strip().split(")") for line in f.readlines()]
 
-    orbit_map = map_orbits(orbits)
-    checksum = orbit_checksum(orbit_map["COM"])
+    tree = OrbitTree.build(orbits)
+    checksum = tree.checksum()
     assert checksum == 314247
 
-    ancestor = lowest_common_ancestor(orbit_map["COM"], "YOU", "SAN")
-    san_to_ancestor = orbit_map["SAN"].orbits - ancestor.orbits - 1
-    you_to_ancestor = orbit_map["YOU"].orbits - ancestor.orbits - 1
-    assert san_to_ancestor + you_to_ancestor == 514
+    # The same checksum can be kept up to date while orbits stream in
+    orbit_map = OrbitMap()
+    orbit_map.extend((target, orbiter) for target, orbiter in orbits)
+    assert orbit_map.checksum == checksum
+
+    # Transfers happen between the objects YOU and SAN are orbiting
+    transfers = tree.distance(tree.parent("YOU"), tree.parent("SAN"))
+    assert transfers == 514
@@ -1,45 +1,50 @@
 import os
 import itertools
-from typing import List
-from vm import Machine
+from typing import List, Tuple
+from vm import Machine, Memory
+from batch import BatchMachine
+from network import Network, Outcome
+from sweep import sweep
+from image import load_program
 
 
-if __name__ == "__main__":
-
-    with open(os.path.join("inputs", "day7.in")) as f:
-        program = [int(opcode) for opcode in f.read().strip().split(",")]
-
-    # First part
-    series_signals: List[int] = []
-    for sequence in itertools.permutations(range(5)):
-        amplifier_input = 0
-        for setting in sequence:
-            amplifier = Machine(program, [setting, amplifier_input])
-            amplifier.execute()
-            amplifier_input = amplifier.output[0]
-        series_signals.append(amplifier_input)
-    assert max(series_signals) == 20413
+def feedback_signal(program: Memory, sequence: Tuple[int, ...]) -> int:
 
-    # Second part
-    feedback_signals: List[int] = []
-    for sequence in itertools.permutations(range(5, 10)):
+    amps = [Machine(program, [setting]) for setting in sequence]
+    network = Network.ring(amps)
 
-        amps = [
-            Machine(program, [setting], pause_on_output=True) for setting in sequence
-        ]
+    # Kickstart the first amplifier with zero signal
+    network.send(0, 0)
+    assert network.run() is Outcome.HALTED
 
-        # Kickstart the first amplifier with zero signal
-        amps[0].inputs.append(0)
+    # The last amplifier's final signal is left waiting for the halted first one
+    return amps[0].inputs[-1]
 
-        # The feedback loop halts when the last amplifier halts
-        while not amps[-1].halted:
 
-            for amp_no, amp in enumerate(amps):
-
-                amp.execute()
-                output_signal = amp.output[-1]
-                amps[(amp_no + 1) % len(amps)].inputs.append(output_signal)
+if __name__ == "__main__":
 
-        feedback_signals.append(amps[-1].output[-1])
+    program = load_program(os.path.join("inputs", "day7.in"))
+
+    # First part - run each amplifier stage for every sequence at once
+    sequences = list(itertools.permutations(range(5)))
+    series_signals: List[int] = [0 for _ in sequences]
+    for stage in range(5):
+        amplifiers = BatchMachine.from_program(
+            program,
+            [
+                [sequence[stage], signal]
+                for sequence, signal in zip(sequences, series_signals)
+            ],
+        )
+        amplifiers.execute()
+        series_signals = amplifiers.output[:, 0].tolist()
+    assert max(series_signals) == 20413
 
+    # Second part - each sequence runs in a separate process
+    feedback_signals = [
+        signal
+        for _, signal in sweep(
+            program, itertools.permutations(range(5, 10)), feedback_signal
+        )
+    ]
     assert max(feedback_signals) == 3321777
@@ -1,60 +1,100 @@
+from __future__ import annotations
 import os
 import collections
-from dataclasses import dataclass, field
-from typing import List, DefaultDict
+import numpy as np
+from dataclasses import dataclass
+from typing import Iterator
 
 Dimensions = collections.namedtuple("Dimensions", ["w", "h"])
 
+# Pixels are kept as the digits of the file so they are offset by this much
+ZERO = ord("0")
+TRANSPARENT = ord("2")
 
-@dataclass
-class Layer:
-
-    rows: List[List[int]]
-    counts: DefaultDict[int, int] = field(
-        default_factory=lambda: collections.defaultdict(int)
-    )
-
-    def __post_init__(self) -> None:
-        for row in self.rows:
-            for pixel in row:
-                self.counts[pixel] += 1
-
+# Layers processed at once are limited to about this many bytes, which the
+# digit counts need eight times over as temporaries
+CHUNK_SIZE = 8 << 20
 
-def parse_layers(pixels: List[int], dimensions: Dimensions) -> List[Layer]:
 
-    layers: List[Layer] = []
-
-    while pixels:
-        layer_pixels: List[List[int]] = []
-        for _ in range(dimensions.h):
-            layer_pixels.append(pixels[: dimensions.w])
-            pixels = pixels[dimensions.w :]
-        layers.append(Layer(layer_pixels))
-
-    return layers
+@dataclass
+class Image:
+    """
+    Space image memory mapped straight from its file as an array of layers
+    of rows of pixels. Nothing is copied until chunks of layers are read.
+    """
+
+    dimensions: Dimensions
+    pixels: np.ndarray
+
+    @classmethod
+    def open(cls, path: str, dimensions: Dimensions) -> Image:
+
+        # Anything after the last whole layer, such as a newline, is left out
+        layers = os.path.getsize(path) // (dimensions.w * dimensions.h)
+        pixels = np.memmap(
+            path, np.uint8, "r", shape=(layers, dimensions.h, dimensions.w)
+        )
+        return cls(dimensions, pixels)
+
+    def chunks(self, chunk_size: int = CHUNK_SIZE) -> Iterator[np.ndarray]:
+
+        step = max(1, chunk_size // (self.dimensions.w * self.dimensions.h))
+        for start in range(0, len(self.pixels), step):
+            yield self.pixels[start : start + step]
+
+    def checksum(self, chunk_size: int = CHUNK_SIZE) -> int:
+        """
+        Number of 1 digits multiplied by the number of 2 digits on the layer
+        with the fewest 0 digits
+        """
+
+        fewest_zeroes = None
+        checksum = 0
+        for chunk in self.chunks(chunk_size):
+            # Count the digits of every layer with a single bincount by
+            # giving every layer a range of ten bins of its own
+            layers = len(chunk)
+            bins = chunk.reshape(layers, -1) - ZERO + 10 * np.arange(
+                layers, dtype=np.int64
+            ).reshape(-1, 1)
+            counts = np.bincount(bins.ravel(), minlength=10 * layers)
+            counts = counts.reshape(layers, 10)
+
+            layer = int(counts[:, 0].argmin())
+            if fewest_zeroes is None or counts[layer, 0] < fewest_zeroes:
+                fewest_zeroes = counts[layer, 0]
+                checksum = int(counts[layer, 1] * counts[layer, 2])
+
+        return checksum
+
+    def composite(self, chunk_size: int = CHUNK_SIZE) -> np.ndarray:
+        """Stacks the layers on top of each other, the first one on top"""
+
+        image = np.full(
+            (self.dimensions.h, self.dimensions.w), TRANSPARENT, dtype=np.uint8
+        )
+        for chunk in self.chunks(chunk_size):
+            # Pick the first pixel which is not transparent on any layer of
+            # the chunk for every pixel which is still transparent
+            opaque = chunk != TRANSPARENT
+            first = opaque.argmax(axis=0)
+            pixels = np.take_along_axis(chunk, first[np.newaxis], axis=0)[0]
+            image = np.where(image == TRANSPARENT, pixels, image)
+            if not (image == TRANSPARENT).any():
+                break
+
+        return image - ZERO
 
 
 if __name__ == "__main__":
 
-    with open(os.path.join("inputs", "day8.in")) as f:
-        pixels = [int(pixel) for pixel in f.read().strip()]
-
-    layers = parse_layers(pixels, Dimensions(25, 6))
+    image = Image.open(os.path.join("inputs", "day8.in"), Dimensions(25, 6))
 
     # First part
-    fewest_zeroes = min(layers, key=lambda layer: layer.counts[0])
-    assert fewest_zeroes.counts[1] * fewest_zeroes.counts[2] == 1703
+    assert image.checksum() == 1703
 
     # Second part
-    composite: List[List[int]] = layers[-1].rows
-
-    for layer in reversed(layers[:-1]):
-        for y in range(len(layer.rows)):
-            for x in range(len(layer.rows[y])):
-                pixel = layer.rows[y][x]
-                # Ignore transparent pixels
-                if pixel != 2:
-                    composite[y][x] = pixel
+    composite = image.composite()
 
     pixel_map = {1: "*", 0: " "}
     for row in composite:
@@ -1,11 +1,11 @@
 import os
 from vm import Machine
+from image import load_program
 
 
 if __name__ == "__main__":
 
-    with open(os.path.join("inputs", "day9.in")) as f:
-        boost = [int(instruction) for instruction in f.read().strip().split(",")]
+    boost = load_program(os.path.join("inputs", "day9.in"))
 
     # First part
     machine = Machine(boost, [1])
@@ -0,0 +1,167 @@
+from array import array
+from typing import Iterable, Iterator, List, Tuple
+
+Position = Tuple[int, int]
+
+
+class Grid:
+    """
+    Dense two-dimensional grid of small integer cell codes. Cells outside of
+    the area written to so far read as fill without being stored, and the
+    grid grows to fit whatever gets written to it. Cells are laid out row by
+    row so a position maps to a single index, which is what the search
+    functions work with.
+    """
+
+    def __init__(self, fill: int = 0) -> None:
+
+        self.fill = fill
+        self.left = 0
+        self.top = 0
+        self.width = 0
+        self.height = 0
+        self.cells = bytearray()
+
+    def __contains__(self, position: Position) -> bool:
+
+        x, y = position
+        return (
+            self.left <= x < self.left + self.width
+            and self.top <= y < self.top + self.height
+        )
+
+    def __getitem__(self, position: Position) -> int:
+
+        if position not in self:
+            return self.fill
+        return self.cells[self.index(position)]
+
+    def __setitem__(self, position: Position, code: int) -> None:
+
+        if position not in self:
+            self.grow(position)
+        self.cells[self.index(position)] = code
+
+    def index(self, position: Position) -> int:
+
+        x, y = position
+        return (y - self.top) * self.width + x - self.left
+
+    def position(self, index: int) -> Position:
+
+        y, x = divmod(index, self.width)
+        return x + self.left, y + self.top
+
+    def grow(self, position: Position) -> None:
+
+        # Grow at least by half in every direction which needs it so that
+        # filling in a large area one cell at a time stays linear
+        x, y = position
+        if not self.width:
+            left, top, right, bottom = x, y, x + 1, y + 1
+        else:
+            left, top = self.left, self.top
+            right, bottom = left + self.width, top + self.height
+            margin_x, margin_y = self.width // 2 + 1, self.height // 2 + 1
+            if x < left:
+                left = min(x, left - margin_x)
+            elif x >= right:
+                right = max(x + 1, right + margin_x)
+            if y < top:
+                top = min(y, top - margin_y)
+            elif y >= bottom:
+                bottom = max(y + 1, bottom + margin_y)
+
+        width = right - left
+        cells = bytearray([self.fill]) * (width * (bottom - top))
+        for row in range(self.height):
+            start = (self.top + row - top) * width + self.left - left
+            cells[start : start + self.width] = self.cells[
+                row * self.width : (row + 1) * self.width
+            ]
+
+        self.left, self.top = left, top
+        self.width, self.height = width, bottom - top
+        self.cells = cells
+
+    def find(self, code: int) -> Iterator[Position]:
+
+        index = self.cells.find(code)
+        while index != -1:
+            yield self.position(index)
+            index = self.cells.find(code, index + 1)
+
+    def bounds(self) -> Tuple[int, int, int, int]:
+        """Left, top, right and bottom edges of the cells which are not fill"""
+
+        columns: List[int] = []
+        rows: List[int] = []
+        for y, row in enumerate(self.rows()):
+            used = [x for x, code in enumerate(row) if code != self.fill]
+            if used:
+                rows.append(y)
+                columns.extend((used[0], used[-1]))
+        if not rows:
+            return 0, 0, 0, 0
+        return (
+            self.left + min(columns),
+            self.top + rows[0],
+            self.left + max(columns) + 1,
+            self.top + rows[-1] + 1,
+        )
+
+    def rows(self) -> Iterator[bytearray]:
+
+        for row in range(self.height):
+            yield self.cells[row * self.width : (row + 1) * self.width]
+
+
+def distances(
+    grid: Grid, sources: Iterable[Position], passable: Iterable[int]
+) -> "array[int]":
+    """
+    Breadth-first search from every source at once through the cells whose
+    code is passable. Returns the distance to the nearest source for every
+    index of the grid, or -1 for cells which can not be reached.
+    """
+
+    width = grid.width
+    size = len(grid.cells)
+    cells = grid.cells
+    allowed = set(passable)
+    open_codes = bytes(code in allowed for code in range(256))
+    distance = array("i", [-1]) * size
+
+    frontier: List[int] = []
+    for source in sources:
+        if source not in grid:
+            continue
+        index = grid.index(source)
+        if distance[index] == -1:
+            distance[index] = 0
+            frontier.append(index)
+
+    # Every cell is marked as soon as it is reached so it is never queued
+    # twice, and the search goes one whole distance at a time
+    steps = 0
+    while frontier:
+        steps += 1
+        reached = []
+        for index in frontier:
+            neighbors = []
+            if index >= width:
+                neighbors.append(index - width)
+            if index + width < size:
+                neighbors.append(index + width)
+            column = index % width
+            if column:
+                neighbors.append(index - 1)
+            if column < width - 1:
+                neighbors.append(index + 1)
+            for neighbor in neighbors:
+                if distance[neighbor] == -1 and open_codes[cells[neighbor]]:
+                    distance[neighbor] = steps
+                    reached.append(neighbor)
+        frontier = reached
+
+    return distance
@@ -0,0 +1,114 @@
+import os
+import sys
+import mmap
+import zlib
+import struct
+from array import array
+from typing import List, Sequence
+
+# magic, version, flags, source size, source mtime, cell count, payload crc32
+HEADER = struct.Struct("<4sHHQqQI")
+MAGIC = b"ICIM"
+VERSION = 1
+
+# The payload holds the program as text since some value does not fit in 64 bits
+WIDE = 1
+
+
+def image_path(path: str) -> str:
+    return os.path.splitext(path)[0] + ".img"
+
+
+def parse(text: str) -> List[int]:
+    return [int(value) for value in text.strip().split(",")]
+
+
+def write_image(path: str) -> List[int]:
+    """
+    Parses the program in path and writes its image next to it if possible
+    """
+
+    with open(path) as f:
+        text = f.read()
+    program = parse(text)
+
+    try:
+        payload = array("q", program)
+        if sys.byteorder != "little":
+            payload.byteswap()
+        data, flags = payload.tobytes(), 0
+    except OverflowError:
+        data, flags = ",".join(str(value) for value in program).encode(), WIDE
+
+    # Write to a temporary file first so that readers never see half an image
+    temporary = image_path(path) + f".{os.getpid()}"
+    try:
+        stat = os.stat(path)
+        header = HEADER.pack(
+            MAGIC,
+            VERSION,
+            flags,
+            stat.st_size,
+            stat.st_mtime_ns,
+            len(program),
+            zlib.crc32(data),
+        )
+        with open(temporary, "wb") as f:
+            f.write(header)
+            f.write(data)
+        os.replace(temporary, image_path(path))
+    except OSError:
+        # The image is only a cache so the program is used as parsed without it
+        try:
+            os.remove(temporary)
+        except OSError:
+            pass
+
+    return program
+
+
+def read_image(path: str) -> Sequence[int]:
+    """
+    Memory maps the image of the program in path. Raises ValueError if the
+    image is damaged or no longer matches the program it was created from.
+    """
+
+    stat = os.stat(path)
+    with open(image_path(path), "rb") as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    if len(mapped) < HEADER.size:
+        raise ValueError("Truncated image")
+    magic, version, flags, size, mtime, count, checksum = HEADER.unpack_from(mapped)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("Not a program image")
+    if size != stat.st_size or mtime != stat.st_mtime_ns:
+        raise ValueError("Image is out of date")
+
+    data = memoryview(mapped)[HEADER.size :]
+    if zlib.crc32(data) != checksum:
+        raise ValueError("Image checksum does not match")
+
+    if flags & WIDE:
+        return parse(bytes(data).decode())
+    if len(data) != count * 8:
+        raise ValueError("Truncated image")
+    if sys.byteorder != "little":
+        program = array("q")
+        program.frombytes(data)
+        program.byteswap()
+        return program
+    return data.cast("q")
+
+
+def load_program(path: str) -> Sequence[int]:
+    """
+    Loads the Intcode program in path. The parsed program is cached in an
+    image file next to it which is memory mapped on later loads instead of
+    parsing the program again.
+    """
+
+    try:
+        return read_image(path)
+    except (OSError, ValueError):
+        return write_image(path)
@@ -0,0 +1,146 @@
+from __future__ import annotations
+import time
+import collections
+from dataclasses import dataclass, field
+from enum import IntEnum, unique
+from typing import Deque, Dict, Hashable, List, Sequence, Set
+
+from vm import Channel, Machine
+
+
+@unique
+class Outcome(IntEnum):
+
+    HALTED = 0
+    DEADLOCK = 1
+
+
+@dataclass
+class Node:
+
+    name: Hashable
+    machine: Machine
+    targets: List[Node] = field(default_factory=list)
+    instructions: int = 0
+    slices: int = 0
+    seconds: float = 0.0
+
+    @property
+    def throughput(self) -> float:
+        """Instructions per second spent running this node"""
+        return self.instructions / self.seconds if self.seconds else 0.0
+
+
+@dataclass
+class Network:
+    """
+    Schedules a graph of machines connected by channels.
+
+    Every machine's output is delivered to the inputs of the machines it is
+    connected to. Only runnable machines are scheduled, round-robin, each
+    for at most quantum instructions at a time. A machine which is blocked
+    on input sleeps until one of its sources sends it something. Outputs of
+    machines without any targets stay in their output channels.
+    """
+
+    quantum: int = 1000
+    nodes: Dict[Hashable, Node] = field(default_factory=dict)
+    ready: Deque[Node] = field(default_factory=collections.deque)
+    queued: Set[Hashable] = field(default_factory=set)
+
+    @classmethod
+    def chain(cls, machines: Sequence[Machine], quantum: int = 1000) -> Network:
+
+        network = cls(quantum)
+        for name, machine in enumerate(machines):
+            network.add(name, machine)
+        for name in range(1, len(machines)):
+            network.connect(name - 1, name)
+        return network
+
+    @classmethod
+    def ring(cls, machines: Sequence[Machine], quantum: int = 1000) -> Network:
+
+        network = cls.chain(machines, quantum)
+        network.connect(len(machines) - 1, 0)
+        return network
+
+    def add(self, name: Hashable, machine: Machine) -> Node:
+
+        node = Node(name, machine)
+        self.nodes[name] = node
+        self.wake(node)
+        return node
+
+    def connect(self, source: Hashable, target: Hashable) -> None:
+
+        node = self.nodes[source]
+        node.targets.append(self.nodes[target])
+        if len(node.targets) == 1:
+            # Hand over everything the machine has already written as well
+            pending = list(node.machine.output)
+            node.machine.output = Channel(
+                consumer=lambda values: self.deliver(node, values)
+            )
+            if pending:
+                self.deliver(node, pending)
+
+    def deliver(self, source: Node, values: List[int]) -> None:
+
+        for target in source.targets:
+            target.machine.inputs.extend(values)
+            self.wake(target)
+
+    def send(self, name: Hashable, *values: int) -> None:
+
+        node = self.nodes[name]
+        node.machine.inputs.extend(values)
+        self.wake(node)
+
+    def wake(self, node: Node) -> None:
+
+        if node.name not in self.queued:
+            self.queued.add(node.name)
+            self.ready.append(node)
+
+    def run(self) -> Outcome:
+        """
+        Runs until every machine has halted or the machines which are left
+        are all waiting for input which will never arrive
+        """
+
+        while self.ready:
+
+            node = self.ready.popleft()
+            self.queued.discard(node.name)
+            machine = node.machine
+
+            started = time.perf_counter()
+            cycles = machine.cycles
+            machine.execute(self.quantum)
+            node.seconds += time.perf_counter() - started
+            node.instructions += machine.cycles - cycles
+            node.slices += 1
+
+            if not machine.halted and not machine.waiting:
+                self.wake(node)
+
+        if all(node.machine.halted for node in self.nodes.values()):
+            return Outcome.HALTED
+        return Outcome.DEADLOCK
+
+    @property
+    def blocked(self) -> List[Hashable]:
+        return [name for name, node in self.nodes.items() if node.machine.waiting]
+
+    def stats(self) -> Dict[Hashable, Dict[str, float]]:
+
+        return {
+            name: {
+                "instructions": node.instructions,
+                "slices": node.slices,
+                "seconds": node.seconds,
+                "throughput": node.throughput,
+            }
+            for name, node in self.nodes.items()
+        }
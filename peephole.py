@@ -0,0 +1,38 @@
+import sys
+import json
+import collections
+from typing import Any, Dict, Sequence
+
+from image import load_program
+from vm import Machine, Memory, fuse
+
+
+def report(program: Sequence[int], inputs: Sequence[int]) -> Dict[str, Any]:
+    """
+    Runs the program and reports the superinstructions found in it and how
+    many dispatches the interpreter saved by executing them
+    """
+
+    memory = Memory(program)
+    sites = collections.Counter(
+        superinstruction.fusion.name for superinstruction in fuse(memory).values()
+    )
+
+    machine = Machine(memory, list(inputs))
+    machine.execute()
+
+    return {
+        "superinstructions": dict(sites),
+        "instructions": machine.cycles,
+        "dispatches": machine.cycles - machine.fusions,
+        "saved": machine.fusions,
+        "saved_ratio": machine.fusions / machine.cycles if machine.cycles else 0.0,
+    }
+
+
+if __name__ == "__main__":
+
+    # Usage: python peephole.py inputs/day9.in 2
+    program = load_program(sys.argv[1])
+    inputs = [int(value) for value in sys.argv[2:]]
+    print(json.dumps(report(program, inputs), indent=2))
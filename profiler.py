@@ -0,0 +1,111 @@
+import sys
+import json
+import collections
+from dataclasses import dataclass, field
+from typing import Any, Counter, Dict, Optional, Tuple
+
+from image import load_program
+from vm import Machine, Mode, Opcode, PAGE_BITS, PAGE_SIZE, PARAMETERS, decode
+
+# Which parameter of an instruction is the address it writes to
+WRITES = {
+    Opcode.ADD: 2,
+    Opcode.MULTIPLY: 2,
+    Opcode.LESS_THAN: 2,
+    Opcode.EQUALS: 2,
+    Opcode.SAVE: 0,
+}
+
+
+@dataclass
+class Profile:
+    """
+    Records where machines spend their time. Attach it to a machine with
+    Machine(program, inputs, profile=Profile()) and every instruction the
+    machine executes gets recorded. Forks of a profiled machine keep adding
+    to the same profile.
+
+    Memory accesses are counted per page sized address range and loops are
+    identified by the backward jumps taken to their first instruction.
+    """
+
+    instructions: int = 0
+    opcodes: Counter[str] = field(default_factory=collections.Counter)
+    hits: Counter[int] = field(default_factory=collections.Counter)
+    reads: Counter[int] = field(default_factory=collections.Counter)
+    writes: Counter[int] = field(default_factory=collections.Counter)
+    loops: Counter[Tuple[int, int]] = field(default_factory=collections.Counter)
+
+    def execute(self, machine: Machine, limit: Optional[int] = None) -> None:
+
+        executed = 0
+        while limit is None or executed < limit:
+
+            ip = machine.ip
+            rb = machine.relative_base
+            instruction = decode(machine.memory[ip])
+            opcode = instruction.opcode
+            params = machine.memory.fetch(ip + 1, PARAMETERS[opcode])
+
+            # Step a single instruction at a time using the interpreter
+            cycles = machine.cycles
+            machine.interpret(1)
+            if machine.cycles == cycles:
+                return
+
+            executed += 1
+            self.instructions += 1
+            self.opcodes[opcode.name] += 1
+            self.hits[ip] += 1
+
+            for i, (mode, param) in enumerate(zip(instruction.modes, params)):
+                addr = param + rb if mode is Mode.RELATIVE else param
+                if WRITES.get(opcode) == i:
+                    self.writes[addr >> PAGE_BITS] += 1
+                elif mode is not Mode.IMMEDIATE:
+                    self.reads[addr >> PAGE_BITS] += 1
+
+            if (
+                opcode is Opcode.JUMP_IF_TRUE or opcode is Opcode.JUMP_IF_FALSE
+            ) and machine.ip <= ip:
+                self.loops[(machine.ip, ip)] += 1
+
+            if opcode is Opcode.PRINT and machine.pause_on_output:
+                return
+
+    def as_dict(self, top: int = 10) -> Dict[str, Any]:
+        def ranges(counter: Counter[int]) -> Dict[str, int]:
+            return {
+                f"{page * PAGE_SIZE}-{(page + 1) * PAGE_SIZE - 1}": count
+                for page, count in sorted(counter.items())
+            }
+
+        return {
+            "instructions": self.instructions,
+            "opcodes": dict(self.opcodes.most_common()),
+            "hottest": [
+                {"ip": ip, "hits": hits} for ip, hits in self.hits.most_common(top)
+            ],
+            "reads": ranges(self.reads),
+            "writes": ranges(self.writes),
+            "loops": [
+                {"start": start, "end": end, "iterations": iterations}
+                for (start, end), iterations in self.loops.most_common(top)
+            ],
+        }
+
+    def to_json(self, top: int = 10) -> str:
+        return json.dumps(self.as_dict(top), indent=2)
+
+
+if __name__ == "__main__":
+
+    # Usage: python profiler.py inputs/day9.in 2
+    program = load_program(sys.argv[1])
+
+    profile = Profile()
+    inputs = [int(value) for value in sys.argv[2:]]
+    machine = Machine(program, inputs, profile=profile)
+    machine.execute()
+
+    print(profile.to_json())
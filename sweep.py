@@ -0,0 +1,104 @@
+import os
+import itertools
+import collections
+import concurrent.futures
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import (
+    Callable,
+    Deque,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    TypeVar,
+)
+
+from vm import Memory
+
+P = TypeVar("P")
+R = TypeVar("R")
+
+# The program each worker process runs, set up once when the worker starts
+_program: Optional[Memory] = None
+
+
+def _initialize(program: Sequence[int]) -> None:
+
+    global _program
+    _program = Memory(program)
+
+
+def _run_chunk(run: Callable[[Memory, P], R], chunk: List[P]) -> List[R]:
+
+    assert _program is not None
+    return [run(_program, params) for params in chunk]
+
+
+def sweep(
+    program: Sequence[int],
+    parameters: Iterable[P],
+    run: Callable[[Memory, P], R],
+    until: Optional[Callable[[R], bool]] = None,
+    ordered: bool = True,
+    workers: Optional[int] = None,
+    chunksize: int = 64,
+) -> Iterator[Tuple[P, R]]:
+    """
+    Calls run(program, params) for every set of parameters using a pool of
+    worker processes and yields (params, result) pairs.
+
+    The program is sent to each worker once and run receives it as a Memory
+    which machines can be created from cheaply. run has to be a module level
+    function so that it can be pickled. Parameters are consumed lazily in
+    chunks so only a couple of chunks per worker are in flight at a time.
+    Results are yielded in the order of the parameters unless ordered is
+    False, in which case they are yielded as soon as their chunk completes.
+    Once until returns True for a result that result is yielded last and the
+    remaining work is cancelled, which also happens if the caller stops
+    iterating early.
+    """
+
+    workers = workers or os.cpu_count() or 1
+    remaining = iter(parameters)
+    executor = ProcessPoolExecutor(
+        max_workers=workers, initializer=_initialize, initargs=(list(program),)
+    )
+
+    pending: Deque[Future] = collections.deque()
+    chunks: Dict[Future, List[P]] = {}
+
+    def submit() -> None:
+        chunk = list(itertools.islice(remaining, chunksize))
+        if chunk:
+            future = executor.submit(_run_chunk, run, chunk)
+            pending.append(future)
+            chunks[future] = chunk
+
+    try:
+        for _ in range(2 * workers):
+            submit()
+
+        while pending:
+
+            if ordered:
+                future = pending.popleft()
+            else:
+                done, _ = concurrent.futures.wait(
+                    pending, return_when=concurrent.futures.FIRST_COMPLETED
+                )
+                future = done.pop()
+                pending.remove(future)
+
+            chunk = chunks.pop(future)
+            results = future.result()
+            submit()
+
+            for params, result in zip(chunk, results):
+                yield params, result
+                if until is not None and until(result):
+                    return
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
@@ -1,5 +1,31 @@
-from dataclasses import dataclass, field
-from typing import List, ClassVar
+from __future__ import annotations
+import copy
+import asyncio
+import itertools
+import collections
+from array import array
+from dataclasses import dataclass, field, InitVar
+from typing import (
+    Any,
+    Callable,
+    Deque,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    Type,
+    TypeVar,
+    Union,
+    overload,
+    TYPE_CHECKING,
+)
+
+if TYPE_CHECKING:
+    from profiler import Profile
 from enum import IntEnum, unique
 
 
@@ -35,122 +61,606 @@ class Instruction:
 
     instruction: int
     opcode: Opcode = field(init=False)
-    modes: List[Mode] = field(init=False)
+    modes: Tuple[Mode, Mode, Mode] = field(init=False)
 
     def __post_init__(self) -> None:
         self.opcode = Opcode(self.instruction % 100)
-        self.modes = [
+        self.modes = (
             Mode(self.instruction // 100 % 10),
             Mode(self.instruction // 1000 % 10),
             Mode(self.instruction // 10000 % 10),
-        ]
+        )
+
+
+# Number of parameters each instruction takes
+PARAMETERS = {
+    Opcode.ADD: 3,
+    Opcode.MULTIPLY: 3,
+    Opcode.SAVE: 1,
+    Opcode.PRINT: 1,
+    Opcode.JUMP_IF_TRUE: 2,
+    Opcode.JUMP_IF_FALSE: 2,
+    Opcode.LESS_THAN: 3,
+    Opcode.EQUALS: 3,
+    Opcode.RELATIVE_BASE: 1,
+    Opcode.HALT: 0,
+}
+
+
+# Decoded instructions keyed by their value. Since the key is the value
+# stored in memory and not the address, a program overwriting its own code
+# simply looks up a different entry so the cache never needs invalidating.
+# Only the last five digits make up the opcode and the modes, so keying by
+# those keeps the cache from growing with every data value that gets decoded.
+_decoded: Dict[int, Instruction] = {}
+
+# Values are decoded by their remainder modulo this
+INSTRUCTION_RANGE = 100000
+
+
+def decode(instruction: int) -> Instruction:
+
+    key = instruction % INSTRUCTION_RANGE
+    decoded = _decoded.get(key)
+    if decoded is None:
+        try:
+            decoded = Instruction(key)
+        except ValueError:
+            raise UnknownOpcode(f"Unknown opcode: {instruction}")
+        _decoded[key] = decoded
+    return decoded
+
+
+PAGE_BITS = 8
+PAGE_SIZE = 1 << PAGE_BITS
+PAGE_MASK = PAGE_SIZE - 1
+
+# Pages are compact arrays of 64-bit integers unless they have had to hold
+# a value outside of that range, in which case they are lists of Python ints
+Page = Union["array[int]", List[int]]
+
+# Every page which has never been written to is this same page of zeroes
+_ZERO_PAGE: Page = array("q", bytes(8 * PAGE_SIZE))
+
+
+def _page(cells: Sequence[int]) -> Page:
+
+    try:
+        return array("q", cells)
+    except OverflowError:
+        return list(cells)
+
+
+class Pages(Dict[int, Page]):
+    def __missing__(self, page: int) -> Page:
+        return _ZERO_PAGE
+
+
+class Memory:
+    """
+    Paged copy-on-write memory. Copies made with fork() share their pages
+    until one of them writes to a page, at which point the writer gets its
+    own copy of that page. Pages which have never been written to read as
+    zeroes without being allocated so sparse high addresses are cheap.
+
+    Pages are stored as arrays of 64-bit integers and a page is turned into
+    a list of arbitrary precision integers once a value which does not fit
+    is written to it.
+    """
+
+    def __init__(self, program: Sequence[int] = ()) -> None:
+
+        self.pages = Pages()
+        # Pages this memory is free to write to without copying them first
+        self.owned: Set[int] = set()
+        # Superinstructions found in the memory, looked for once it first runs
+        self.fused: Optional[Dict[int, Superinstruction]] = None
+
+        for page, offset in enumerate(range(0, len(program), PAGE_SIZE)):
+            cells = list(program[offset : offset + PAGE_SIZE])
+            cells.extend([0] * (PAGE_SIZE - len(cells)))
+            self.pages[page] = _page(cells)
+            self.owned.add(page)
+
+    def fork(self) -> Memory:
+
+        memory = Memory()
+        memory.pages.update(self.pages)
+        # Copies share the superinstructions too as they start out identical
+        if self.fused is None:
+            self.fused = fuse(self)
+        memory.fused = self.fused
+        # Both copies now share every page
+        self.owned.clear()
+        return memory
+
+    @overload
+    def __getitem__(self, addr: int) -> int:
+        ...
+
+    @overload
+    def __getitem__(self, addr: slice) -> List[int]:
+        ...
+
+    def __getitem__(self, addr: Union[int, slice]) -> Union[int, List[int]]:
+
+        if isinstance(addr, slice):
+            start, stop, step = addr.start or 0, addr.stop, addr.step or 1
+            return [self[a] for a in range(start, stop, step)]
+        return self.pages[addr >> PAGE_BITS][addr & PAGE_MASK]
+
+    def fetch(self, addr: int, count: int) -> Sequence[int]:
+
+        offset = addr & PAGE_MASK
+        if offset + count <= PAGE_SIZE:
+            return self.pages[addr >> PAGE_BITS][offset : offset + count]
+        return [self[a] for a in range(addr, addr + count)]
+
+    def __setitem__(self, addr: int, value: int) -> None:
+
+        page = addr >> PAGE_BITS
+        if page not in self.owned:
+            self.pages[page] = self.pages[page][:]
+            self.owned.add(page)
+        try:
+            self.pages[page][addr & PAGE_MASK] = value
+        except OverflowError:
+            cells = self.pages[page] = list(self.pages[page])
+            cells[addr & PAGE_MASK] = value
+
+
+@unique
+class Fusion(IntEnum):
+
+    # LESS_THAN or EQUALS followed by a jump on the cell it just wrote
+    COMPARE_JUMP = 0
+    # ADD of an immediate zero or MULTIPLY by an immediate one followed by
+    # a jump which is always taken, which is how programs call functions
+    CALL = 1
+    # RELATIVE_BASE followed by a jump which is always taken
+    RETURN = 2
+
+
+@dataclass
+class Superinstruction:
+    """
+    Two adjacent instructions executed with a single dispatch. Only applies
+    while the cells it was made from still hold the same words, so a program
+    writing over them simply runs them as separate instructions again.
+    """
+
+    fusion: Fusion
+    # Compared against the cells as fetched from memory so a page which
+    # has been turned into a list merely stops matching
+    words: Sequence[int]
+    modes: Tuple[Mode, ...]
+    params: Tuple[int, ...]
+    # Whether the comparison is LESS_THAN and whether it jumps if true
+    less: bool = False
+    when: bool = False
+
+
+# Opcodes which can start a superinstruction
+_FIRST = {
+    Opcode.ADD,
+    Opcode.MULTIPLY,
+    Opcode.LESS_THAN,
+    Opcode.EQUALS,
+    Opcode.RELATIVE_BASE,
+}
+
+
+def _goto(instruction: Instruction, condition: int) -> bool:
+
+    # Jumps on an immediate condition either always or never jump
+    return instruction.modes[0] is Mode.IMMEDIATE and (
+        (instruction.opcode is Opcode.JUMP_IF_TRUE and condition != 0)
+        or (instruction.opcode is Opcode.JUMP_IF_FALSE and condition == 0)
+    )
+
+
+def _fuse_at(memory: Memory, ip: int) -> Optional[Superinstruction]:
+
+    try:
+        first = decode(memory[ip])
+        size = 1 + PARAMETERS[first.opcode]
+        second = decode(memory[ip + size])
+    except UnknownOpcode:
+        return None
+    if second.opcode not in (Opcode.JUMP_IF_TRUE, Opcode.JUMP_IF_FALSE):
+        return None
+
+    words = memory.fetch(ip, size + 3)
+    params = words[1:size]
+    condition, target = words[size + 1 :]
+    opcode = first.opcode
+    modes = first.modes
+
+    if opcode is Opcode.LESS_THAN or opcode is Opcode.EQUALS:
+        # The jump has to read back exactly the cell which was written
+        if (
+            modes[2] is Mode.IMMEDIATE
+            or second.modes[0] is not modes[2]
+            or condition != params[2]
+        ):
+            return None
+        return Superinstruction(
+            Fusion.COMPARE_JUMP,
+            words,
+            (*modes, second.modes[1]),
+            (*params, target),
+            less=opcode is Opcode.LESS_THAN,
+            when=second.opcode is Opcode.JUMP_IF_TRUE,
+        )
+
+    if not _goto(second, condition):
+        return None
+
+    if opcode is Opcode.ADD or opcode is Opcode.MULTIPLY:
+        identity = 0 if opcode is Opcode.ADD else 1
+        if modes[0] is Mode.IMMEDIATE and params[0] == identity:
+            source = 1
+        elif modes[1] is Mode.IMMEDIATE and params[1] == identity:
+            source = 0
+        else:
+            return None
+        return Superinstruction(
+            Fusion.CALL,
+            words,
+            (modes[source], modes[2], second.modes[1]),
+            (params[source], params[2], target),
+        )
+
+    if opcode is Opcode.RELATIVE_BASE:
+        return Superinstruction(
+            Fusion.RETURN, words, (modes[0], second.modes[1]), (params[0], target)
+        )
+
+    return None
+
+
+def fuse(memory: Memory) -> Dict[int, Superinstruction]:
+    """
+    Finds the pairs of instructions in memory which can be executed as
+    superinstructions. Every address is tried since there is no telling
+    code and data apart, which is harmless as data is never executed.
+    """
+
+    fused = {}
+    for number, page in memory.pages.items():
+        for offset, word in enumerate(page):
+            # Rule out most cells before decoding anything
+            if word % 100 not in _FIRST:
+                continue
+            ip = number * PAGE_SIZE + offset
+            superinstruction = _fuse_at(memory, ip)
+            if superinstruction is not None:
+                fused[ip] = superinstruction
+    return fused
+
+
+class Channel(Deque[int]):
+    """
+    FIFO queue of values flowing in or out of a machine.
+
+    Machines read values with receive() and write them with send(). An input
+    channel can be backed by a lazy source such as a generator which is only
+    pulled from once the buffered values run out. An output channel can be
+    bounded with maxlen, in which case old values are dropped like with any
+    deque, or hand values off to a consumer which is called with a list of
+    maxlen values (or every single value if unbounded) as soon as they have
+    been written so that nothing accumulates.
+    """
+
+    def __init__(
+        self,
+        values: Iterable[int] = (),
+        maxlen: Optional[int] = None,
+        consumer: Optional[Callable[[List[int]], Any]] = None,
+        source: Optional[Iterator[int]] = None,
+    ) -> None:
+        super().__init__(values, maxlen)
+        self.consumer = consumer
+        self.source = source
+
+    @classmethod
+    def of(cls, values: Iterable[int]) -> Channel:
+
+        if isinstance(values, Channel):
+            return values
+        # Sized collections are buffered as is, anything else is pulled lazily
+        if isinstance(values, (list, tuple, range, collections.deque)):
+            return cls(values)
+        return cls(source=iter(values))
+
+    def receive(self) -> Optional[int]:
+
+        if self:
+            return self.popleft()
+        if self.source is not None:
+            value = next(self.source, None)
+            if value is None:
+                self.source = None
+            return value
+        return None
+
+    def send(self, value: int) -> None:
+
+        self.append(value)
+        if self.consumer is not None and len(self) >= (self.maxlen or 1):
+            self.consumer(list(self))
+            self.clear()
+
+    def copy(self) -> Channel:
+
+        channel = Channel(self, self.maxlen, self.consumer)
+        if self.source is not None:
+            self.source, channel.source = itertools.tee(self.source)
+        return channel
+
+    def __eq__(self, other: object) -> bool:
+
+        if isinstance(other, (list, tuple)):
+            return list(self) == list(other)
+        return super().__eq__(other)
+
+
+M = TypeVar("M", bound="Machine")
 
 
 @dataclass
 class Machine:
 
-    memory: List[int]
-    inputs: List[int]
+    program: InitVar[Union[Memory, Sequence[int]]]
+    # Any iterable of inputs is accepted and turned into the inputs channel
+    initial_inputs: InitVar[Iterable[int]]
     ip: int = 0
-    output: List[int] = field(default_factory=list)
+    output: Channel = field(default_factory=Channel)
     pause_on_output: bool = False
-    wait_for_input: bool = False
     relative_base: int = 0
-    input_at: int = 0
+    # Opt-in execution profile which slows execution down considerably
+    profile: Optional[Profile] = field(default=None, repr=False)
+    # Number of instructions executed so far
+    cycles: int = field(default=0, init=False)
+    # Number of those executed as part of a superinstruction, each of which
+    # saved a dispatch
+    fusions: int = field(default=0, init=False)
+    memory: Memory = field(init=False)
+    inputs: Channel = field(init=False)
 
-    MEMORY_SIZE: ClassVar[int] = 4096
+    def __post_init__(
+        self, program: Union[Memory, Sequence[int]], initial_inputs: Iterable[int]
+    ) -> None:
+        # Machines created from the same memory share it until they write to it
+        if isinstance(program, Memory):
+            self.memory = program.fork()
+        else:
+            self.memory = Memory(program)
+        self.inputs = Channel.of(initial_inputs)
 
-    def __post_init__(self) -> None:
-        self.memory = self.memory[:] + [
-            0 for _ in range(Machine.MEMORY_SIZE - len(self.memory))
-        ]
+    def fork(self: M) -> M:
+        """Returns an independent copy of the machine in its current state"""
+
+        machine = copy.copy(self)
+        machine.memory = self.memory.fork()
+        machine.inputs = self.inputs.copy()
+        machine.output = self.output.copy()
+        return machine
+
+    @classmethod
+    def template(
+        cls: Type[M], program: Union[Memory, Sequence[int]], **kwargs: Any
+    ) -> M:
+        """
+        Runs the program until it first needs input and returns the machine
+        frozen at that point. Machines spawned from it pick up from there so
+        whatever the program does before reading input is only done once.
+        """
+
+        machine = cls(program, [], **kwargs)
+        while not machine.halted and not machine.waiting:
+            machine.execute()
+        return machine
+
+    def spawn(self: M, inputs: Iterable[int]) -> M:
+        """Returns a fork of the machine which is fed the given inputs"""
+
+        machine = self.fork()
+        machine.inputs.extend(inputs)
+        return machine
 
     @property
     def halted(self) -> bool:
-        return Instruction(self.memory[self.ip]).opcode is Opcode.HALT
+        return decode(self.memory[self.ip]).opcode is Opcode.HALT
+
+    @property
+    def waiting(self) -> bool:
+        """Whether the machine is blocked until more input is available"""
+        return (
+            decode(self.memory[self.ip]).opcode is Opcode.SAVE
+            and not self.inputs
+            and self.inputs.source is None
+        )
+
+    async def run(
+        self,
+        inputs: asyncio.Queue[int],
+        outputs: asyncio.Queue[int],
+        quantum: int = 1000,
+    ) -> None:
+        """
+        Runs the machine as a coroutine until it halts. Input is awaited from
+        and output put to the given queues, and control is handed back to the
+        event loop every quantum instructions.
+        """
+
+        while True:
+
+            self.execute(quantum)
+            while self.output:
+                await outputs.put(self.output.popleft())
+
+            if self.halted:
+                return
+
+            if self.waiting:
+                self.inputs.append(await inputs.get())
+                while not inputs.empty():
+                    self.inputs.append(inputs.get_nowait())
+            else:
+                await asyncio.sleep(0)
 
     def apply_mode(self, mode: Mode, param: int) -> int:
-        if mode is Mode.POSITION:
-            return self.memory[param]
+        if mode is Mode.IMMEDIATE:
+            return param
         elif mode is Mode.RELATIVE:
-            return self.memory[self.relative_base + param]
+            param += self.relative_base
+        return self.memory.pages[param >> PAGE_BITS][param & PAGE_MASK]
+
+    def execute(self, limit: Optional[int] = None) -> None:
+        """
+        Runs the machine until it halts, runs out of input, pauses on output
+        or has executed limit instructions
+        """
+
+        if self.profile is not None:
+            self.profile.execute(self, limit)
         else:
-            return param
+            self.interpret(limit)
+
+    def interpret(self, limit: Optional[int] = None) -> None:
+
+        memory = self.memory
+        pages = memory.pages
+        owned = memory.owned
+        if memory.fused is None:
+            memory.fused = fuse(memory)
+        fused = memory.fused
+        receive = self.inputs.receive
+        send = self.output.send
+        ip = self.ip
+        rb = self.relative_base
+        executed = 0
+        fusions = 0
+        stop = limit if limit is not None else -1
+
+        def load(mode: Mode, param: int) -> int:
+            if mode is Mode.IMMEDIATE:
+                return param
+            elif mode is Mode.RELATIVE:
+                param += rb
+            return pages[param >> PAGE_BITS][param & PAGE_MASK]
 
-    def execute(self) -> None:
-
-        instruction = Instruction(self.memory[self.ip])
-
-        while instruction.opcode is not Opcode.HALT:
-
-            if instruction.opcode is Opcode.ADD:
-                a, b, c = self.memory[self.ip + 1 : self.ip + 4]
-                a = self.apply_mode(instruction.modes[0], a)
-                b = self.apply_mode(instruction.modes[1], b)
-                if instruction.modes[2] is Mode.RELATIVE:
-                    c = self.relative_base + c
-                self.memory[c] = a + b
-                self.ip += 4
-            elif instruction.opcode is Opcode.MULTIPLY:
-                a, b, c = self.memory[self.ip + 1 : self.ip + 4]
-                a = self.apply_mode(instruction.modes[0], a)
-                b = self.apply_mode(instruction.modes[1], b)
-                if instruction.modes[2] is Mode.RELATIVE:
-                    c = self.relative_base + c
-                self.memory[c] = a * b
-                self.ip += 4
-            elif instruction.opcode is Opcode.SAVE:
-                a = self.memory[self.ip + 1]
-                if instruction.modes[0] is Mode.RELATIVE:
-                    a = self.relative_base + a
-                if self.wait_for_input and not self.inputs:
+        def store(mode: Mode, param: int, value: int) -> None:
+            if mode is Mode.RELATIVE:
+                param += rb
+            page = param >> PAGE_BITS
+            if page in owned:
+                try:
+                    pages[page][param & PAGE_MASK] = value
                     return
-                # FIXME: There should be one way to handle inputs, not multiple
-                if self.wait_for_input:
-                    self.memory[a] = self.inputs.pop()
+                except OverflowError:
+                    pass
+            memory[param] = value
+
+        while executed != stop:
+
+            executed += 1
+
+            # Superinstructions run two instructions so there have to be two
+            # left to run, and their cells still have to hold the same words
+            superinstruction = fused.get(ip)
+            if (
+                superinstruction is not None
+                and executed != stop
+                and memory.fetch(ip, len(superinstruction.words))
+                == superinstruction.words
+            ):
+                fusion = superinstruction.fusion
+                modes = superinstruction.modes
+                params = superinstruction.params
+
+                if fusion is Fusion.COMPARE_JUMP:
+                    x = load(modes[0], params[0])
+                    y = load(modes[1], params[1])
+                    flag = x < y if superinstruction.less else x == y
+                    addr = params[2] + rb if modes[2] is Mode.RELATIVE else params[2]
+                    store(modes[2], params[2], int(flag))
+                    if ip <= addr < ip + 7:
+                        # Wrote over the jump so it has to be run on its own
+                        ip += 4
+                        continue
+                    if flag is superinstruction.when:
+                        ip = load(modes[3], params[3])
+                    else:
+                        ip += 7
+                elif fusion is Fusion.CALL:
+                    addr = params[1] + rb if modes[1] is Mode.RELATIVE else params[1]
+                    store(modes[1], params[1], load(modes[0], params[0]))
+                    if ip <= addr < ip + 7:
+                        ip += 4
+                        continue
+                    ip = load(modes[2], params[2])
                 else:
-                    self.memory[a] = self.inputs[self.input_at]
-                    self.input_at += 1
-                self.ip += 2
-            elif instruction.opcode is Opcode.PRINT:
-                a = self.memory[self.ip + 1]
-                msg = self.apply_mode(instruction.modes[0], a)
-                self.output.append(msg)
-                self.ip += 2
+                    rb += load(modes[0], params[0])
+                    ip = load(modes[1], params[1])
+
+                executed += 1
+                fusions += 1
+                continue
+
+            # Fetch the instruction and the largest possible set of parameters
+            # at once unless they happen to straddle two pages
+            offset = ip & PAGE_MASK
+            if offset < PAGE_SIZE - 3:
+                page = pages[ip >> PAGE_BITS]
+                instruction = decode(page[offset])
+                a, b, c = page[offset + 1 : offset + 4]
+            else:
+                instruction = decode(memory[ip])
+                a, b, c = memory.fetch(ip + 1, 3)
+            opcode = instruction.opcode
+            modes = instruction.modes
+
+            if opcode is Opcode.ADD:
+                store(modes[2], c, load(modes[0], a) + load(modes[1], b))
+                ip += 4
+            elif opcode is Opcode.MULTIPLY:
+                store(modes[2], c, load(modes[0], a) * load(modes[1], b))
+                ip += 4
+            elif opcode is Opcode.LESS_THAN:
+                store(modes[2], c, int(load(modes[0], a) < load(modes[1], b)))
+                ip += 4
+            elif opcode is Opcode.EQUALS:
+                store(modes[2], c, int(load(modes[0], a) == load(modes[1], b)))
+                ip += 4
+            elif opcode is Opcode.JUMP_IF_TRUE:
+                ip = load(modes[1], b) if load(modes[0], a) != 0 else ip + 3
+            elif opcode is Opcode.JUMP_IF_FALSE:
+                ip = load(modes[1], b) if load(modes[0], a) == 0 else ip + 3
+            elif opcode is Opcode.RELATIVE_BASE:
+                rb += load(modes[0], a)
+                ip += 2
+            elif opcode is Opcode.SAVE:
+                # Wait for more input to arrive
+                value = receive()
+                if value is None:
+                    executed -= 1
+                    break
+                store(modes[0], a, value)
+                ip += 2
+            elif opcode is Opcode.PRINT:
+                send(load(modes[0], a))
+                ip += 2
                 if self.pause_on_output:
-                    return
-            elif instruction.opcode is Opcode.JUMP_IF_TRUE:
-                a, b = self.memory[self.ip + 1 : self.ip + 3]
-                a = self.apply_mode(instruction.modes[0], a)
-                b = self.apply_mode(instruction.modes[1], b)
-                self.ip = b if a != 0 else self.ip + 3
-            elif instruction.opcode is Opcode.JUMP_IF_FALSE:
-                a, b = self.memory[self.ip + 1 : self.ip + 3]
-                a = self.apply_mode(instruction.modes[0], a)
-                b = self.apply_mode(instruction.modes[1], b)
-                self.ip = b if a == 0 else self.ip + 3
-            elif instruction.opcode is Opcode.LESS_THAN:
-                a, b, c = self.memory[self.ip + 1 : self.ip + 4]
-                a = self.apply_mode(instruction.modes[0], a)
-                b = self.apply_mode(instruction.modes[1], b)
-                if instruction.modes[2] is Mode.RELATIVE:
-                    c = self.relative_base + c
-                self.memory[c] = int(a < b)
-                self.ip += 4
-            elif instruction.opcode is Opcode.EQUALS:
-                a, b, c = self.memory[self.ip + 1 : self.ip + 4]
-                a = self.apply_mode(instruction.modes[0], a)
-                b = self.apply_mode(instruction.modes[1], b)
-                if instruction.modes[2] is Mode.RELATIVE:
-                    c = self.relative_base + c
-                self.memory[c] = int(a == b)
-                self.ip += 4
-            elif instruction.opcode is Opcode.RELATIVE_BASE:
-                a = self.memory[self.ip + 1]
-                a = self.apply_mode(instruction.modes[0], a)
-                self.relative_base += a
-                self.ip += 2
+                    break
+            elif opcode is Opcode.HALT:
+                executed -= 1
+                break
             else:
                 raise UnknownOpcode(f"Unknown opcode: {instruction}")
 
-            instruction = Instruction(self.memory[self.ip])
+        self.ip = ip
+        self.relative_base = rb
+        self.cycles += executed
+        self.fusions += fusions